@@ -1,11 +1,68 @@
 
 # Arquivo principal para configurar o cors, iniciar a aplicação e rotas
+# statsmodels, plotly, o SDK do Gemini e o engine do banco são carregados no primeiro uso;
+# com WARMUP=True eles são carregados em segundo plano logo após o startup.
+import asyncio
+import importlib
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from brotli_asgi import BrotliMiddleware
 from routes.analytics_route import router as analytics_router
+from routes.metrics_route import router as metrics_router
+from forecasting.executor import executor_ajuste
+from forecasting.scheduler import agendador, AGENDADOR_ATIVO
+from database import fechar_async_engine
+from forecasting.metrics import middleware_metricas
 import logging
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+WARMUP = os.getenv("WARMUP", "False") == "True"
+MODULOS_WARMUP = [
+    "statsmodels.tsa.arima.model",
+    "statsmodels.tsa.statespace.sarimax",
+    "plotly.graph_objects",
+    "google.generativeai",
+]
+
+def aquecer():
+    """Importa as dependências pesadas, abre o pool do banco e sobe o forkserver antes da primeira requisição"""
+    from database import get_engine
+
+    for modulo in MODULOS_WARMUP:
+        try:
+            importlib.import_module(modulo)
+        except ImportError as e:
+            logger.warning(f"Warm-up: não foi possível importar {modulo}: {e}")
+    try:
+        with get_engine().connect():
+            pass
+    except Exception as e:
+        logger.warning(f"Warm-up: banco indisponível: {e}")
+    try:
+        executor_ajuste.aquecer()
+    except Exception as e:
+        logger.warning(f"Warm-up: forkserver dos ajustes não subiu: {e}")
+    logger.info("Warm-up concluído")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AGENDADOR_ATIVO:
+        agendador.iniciar()
+    # Em segundo plano, para não atrasar o health check da plataforma
+    aquecimento = asyncio.create_task(asyncio.to_thread(aquecer)) if WARMUP else None
+    yield
+    if aquecimento is not None:
+        await aquecimento
+    await agendador.parar()
+    # Encerra os processos de ajuste junto com a aplicação
+    executor_ajuste.encerrar()
+    # Conexões do engine assíncrono (DB_ASYNC), se ele chegou a ser criado
+    await fechar_async_engine()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,5 +76,13 @@ app.add_middleware(
 def root():
     return {"status": "online ✅"}
 
+# Compressão dos payloads grandes (gráficos) com brotli; cai para gzip quando o cliente não aceita br
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", "1000"))
+app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSAO_MIN_BYTES, gzip_fallback=True)
+
+# Server-Timing com as etapas de cada requisição e perfil opcional (?perfil=1 com PERFIL_ATIVO)
+app.middleware("http")(middleware_metricas)
+
 app.include_router(analytics_router, prefix="/analytics")
+app.include_router(metrics_router)
 logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,91 @@
+# Mede quanto custa `import app` num interpretador novo (o que o primeiro request paga depois
+# que a instância acorda). Usa `python -X importtime` e agrega várias execuções.
+#
+# Uso:
+#   python benchmarks/bench_import.py [--alvo app] [--repeticoes 5] [--top 15] [--saida import.json] [--limite 2.0]
+#
+# Com --limite o script sai com código 1 se a mediana passar do limite (segundos), para uso em CI.
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def medir(alvo: str) -> dict:
+    """Uma execução: tempo de parede do import e tempos por módulo (µs) do -X importtime"""
+    codigo = (
+        "import time; t = time.perf_counter(); "
+        f"import {alvo}; "
+        "print(time.perf_counter() - t)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": RAIZ}
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {alvo}:\n{proc.stderr[-2000:]}")
+
+    modulos = {}
+    for linha in proc.stderr.splitlines():
+        casamento = LINHA_IMPORTTIME.match(linha)
+        if casamento:
+            proprio, acumulado, nome = casamento.groups()
+            modulos[nome] = (int(proprio), int(acumulado))
+    return {"segundos": float(proc.stdout.strip().splitlines()[-1]), "modulos": modulos}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do tempo de import da aplicação")
+    parser.add_argument("--alvo", default="app")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--saida", help="arquivo JSON com o resultado")
+    parser.add_argument("--limite", type=float, help="falha se a mediana passar deste valor (segundos)")
+    args = parser.parse_args(argv)
+
+    execucoes = [medir(args.alvo) for _ in range(args.repeticoes)]
+    tempos = [e["segundos"] for e in execucoes]
+
+    # Mediana por módulo do tempo acumulado (módulo + dependências que ele trouxe)
+    nomes = set().union(*(e["modulos"] for e in execucoes))
+    acumulado = {
+        nome: statistics.median(e["modulos"][nome][1] for e in execucoes if nome in e["modulos"])
+        for nome in nomes
+    }
+    mais_caros = sorted(acumulado.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    resultado = {
+        "alvo": args.alvo,
+        "python": sys.version.split()[0],
+        "repeticoes": args.repeticoes,
+        "mediana_s": statistics.median(tempos),
+        "min_s": min(tempos),
+        "max_s": max(tempos),
+        "modulos_carregados": statistics.median(len(e["modulos"]) for e in execucoes),
+        "mais_caros_ms": {nome: round(us / 1000, 1) for nome, us in mais_caros}
+    }
+
+    print(f"import {args.alvo}: mediana {resultado['mediana_s']:.3f}s "
+          f"(min {resultado['min_s']:.3f}s, max {resultado['max_s']:.3f}s, {args.repeticoes} execuções)")
+    print(f"{resultado['modulos_carregados']:.0f} módulos carregados")
+    print(f"{'módulo':<50}{'acumulado (ms)':>16}")
+    for nome, ms in resultado["mais_caros_ms"].items():
+        print(f"{nome:<50}{ms:>16.1f}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    if args.limite is not None and resultado["mediana_s"] > args.limite:
+        print(f"❌ Mediana acima do limite de {args.limite:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import DisconnectionError, OperationalError
+from sqlalchemy.exc import DBAPIError, DisconnectionError, OperationalError
 from sqlalchemy.pool import Pool
+import asyncio
 import os
+import threading
 import logging
 from dotenv import load_dotenv
 from contextlib import contextmanager
@@ -15,10 +18,12 @@ logger = logging.getLogger(__name__)
 # Carrega o .env
 load_dotenv()
 
-# Configuração da URL do banco
-DATABASE_URL = os.getenv("DATABASE_URL")
+def montar_database_url() -> str:
+    """URL do banco: DATABASE_URL ou as variáveis DB_* separadas"""
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return database_url
 
-if not DATABASE_URL:
     DB_DIALECT = os.getenv("DB_DIALECT", "postgresql")
     DB_USER = os.getenv("DB_USER")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
@@ -29,145 +34,252 @@ if not DATABASE_URL:
     if not all([DB_USER, DB_PASSWORD, DB_NAME]):
         raise ValueError("❌ Variáveis de banco de dados ausentes no .env!")
     
-    DATABASE_URL = (
+    return (
         f"{DB_DIALECT}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
         "?sslmode=require&connect_timeout=30"
     )
 
+# Tamanho do pool vindo do ambiente (o Postgres gratuito do Render aceita poucas conexões)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))            # Número base de conexões
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))     # Conexões extras quando necessário
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))     # Timeout para obter conexão do pool
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))   # Recicla conexões a cada 1 hora
+DB_MAX_TENTATIVAS = int(os.getenv("DB_MAX_TENTATIVAS", "3"))
+DB_ESPERA_TENTATIVA = float(os.getenv("DB_ESPERA_TENTATIVA", "2"))  # base do backoff exponencial (s)
+
 # Configurações otimizadas para Render
 ENGINE_CONFIG = {
-    # Pool de conexões otimizado
-    'pool_size': 5,           # Número base de conexões
-    'max_overflow': 10,       # Conexões extras quando necessário
-    'pool_timeout': 30,       # Timeout para obter conexão do pool
-    'pool_recycle': 3600,     # Recicla conexões a cada 1 hora
-    'pool_pre_ping': True,    # Testa conexões antes de usar
-    
-    # Configurações de reconexão
-    'connect_args': {
-        'sslmode': 'require',
-        'connect_timeout': 30,
-        'keepalives': 1,
-        'keepalives_idle': 30,
-        'keepalives_interval': 10,
-        'keepalives_count': 5,
-        'application_name': 'MyApp'  # Facilita debugging no Render
-    },
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    # Único teste de vida por checkout (um SELECT 1 só quando a conexão sai do pool)
+    'pool_pre_ping': True,
     
     # Echo SQL queries em desenvolvimento
     'echo': os.getenv('DEBUG') == 'True'
 }
 
-# Cria o engine com configurações otimizadas
-engine = create_engine(DATABASE_URL, **ENGINE_CONFIG)
+# Configurações de reconexão (só valem para o psycopg2)
+CONNECT_ARGS_POSTGRES = {
+    'sslmode': 'require',
+    'connect_timeout': 30,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 5,
+    'application_name': 'MyApp'  # Facilita debugging no Render
+}
+
+def configuracao_engine(url: str) -> dict:
+    """ENGINE_CONFIG com connect_args do dialeto (o SQLite não aceita os argumentos do psycopg2)"""
+    config = dict(ENGINE_CONFIG)
+    if make_url(url).get_backend_name() == "postgresql":
+        config['connect_args'] = CONNECT_ARGS_POSTGRES
+    return config
+
+# O engine (e o driver do banco) só é criado no primeiro uso, para não pesar no import do app
+_engine = None
+_session_local = None
+# Serializa a criação dos engines: duas threads no primeiro uso criariam dois pools
+_lock_engine = threading.Lock()
+
+def get_engine():
+    """Engine global, criado sob demanda com as configurações otimizadas"""
+    global _engine, _session_local
+    if _engine is None:
+        with _lock_engine:
+            if _engine is None:
+                url = montar_database_url()
+                engine = create_engine(url, **configuracao_engine(url))
+                # SessionLocal com configurações otimizadas
+                _session_local = sessionmaker(
+                    autocommit=False,
+                    autoflush=False,
+                    bind=engine,
+                    expire_on_commit=False  # Evita problemas com objetos após commit
+                )
+                # Publicado por último: quem vê _engine já encontra _session_local pronto
+                _engine = engine
+    return _engine
+
+# Caminho assíncrono (SQLAlchemy asyncio + asyncpg): os handlers esperam o banco sem prender uma thread.
+# Desligado por padrão; o caminho síncrono (psycopg2) continua sendo o usado sem DB_ASYNC=True.
+DB_ASYNC = os.getenv("DB_ASYNC", "False") == "True"
+
+CONNECT_ARGS_ASYNCPG = {
+    'timeout': 30,
+    'server_settings': {'application_name': 'MyApp'}
+}
+
+def url_async(url: str):
+    """(URL com driver assíncrono, connect_args): asyncpg no Postgres, aiosqlite no SQLite.
+
+    O asyncpg não entende sslmode/connect_timeout na URL; eles viram ssl/timeout.
+    """
+    u = make_url(url)
+    backend = u.get_backend_name()
+    if backend == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite"), {}
+    if backend != "postgresql":
+        raise ValueError(f"❌ DB_ASYNC não suporta o banco '{backend}'")
+
+    query = dict(u.query)
+    connect_args = dict(CONNECT_ARGS_ASYNCPG)
+    connect_args['ssl'] = query.pop('sslmode', CONNECT_ARGS_POSTGRES['sslmode'])
+    if 'connect_timeout' in query:
+        connect_args['timeout'] = float(query.pop('connect_timeout'))
+    return u.set(drivername="postgresql+asyncpg", query=query), connect_args
+
+_async_engine = None
+
+def get_async_engine():
+    """Engine assíncrono global, criado sob demanda com o mesmo pool do síncrono"""
+    global _async_engine
+    if _async_engine is None:
+        with _lock_engine:
+            if _async_engine is None:
+                # Importado só aqui: sem DB_ASYNC o asyncpg nem é carregado
+                from sqlalchemy.ext.asyncio import create_async_engine
+                url, connect_args = url_async(montar_database_url())
+                _async_engine = create_async_engine(url, **ENGINE_CONFIG, connect_args=connect_args)
+    return _async_engine
+
+async def fechar_async_engine():
+    """Fecha as conexões do engine assíncrono (no encerramento da aplicação)"""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+def __getattr__(nome):
+    # Compatibilidade com `from database import engine, SessionLocal`
+    if nome == "engine":
+        return get_engine()
+    if nome == "SessionLocal":
+        get_engine()
+        return _session_local
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
-# Event listener para reconexão automática
 @event.listens_for(Pool, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     """Configura parâmetros da conexão"""
     logger.info("Nova conexão estabelecida com o banco")
 
-@event.listens_for(Pool, "checkout")
-def ping_connection(dbapi_connection, connection_record, connection_proxy):
-    """Testa conexão antes de usar (forma compatível com psycopg2)"""
-    try:
-        cursor = dbapi_connection.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-    except Exception as e:
-        logger.warning(f"Conexão inválida detectada: {e}")
-        raise DisconnectionError()
-
-# SessionLocal com configurações otimizadas
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    expire_on_commit=False  # Evita problemas com objetos após commit
-)
+def erro_de_conexao(e: Exception) -> bool:
+    """Falha de conexão (vale tentar de novo), e não erro da consulta em si"""
+    if isinstance(e, DisconnectionError):
+        return True
+    # OperationalError também cobre timeout de comando, deadlock etc.; só a queda da conexão é repetida
+    return isinstance(e, DBAPIError) and (e.connection_invalidated or getattr(e, "is_disconnect", False))
 
 class DatabaseManager:
-    """Gerenciador de banco com retry logic e tratamento de erros"""
-    
-    def __init__(self):
-        self.max_retries = 3
-        self.retry_delay = 2
+    """Gerenciador de banco com retry logic e tratamento de erros.
+
+    Só é repetido o que é seguro repetir: a obtenção da conexão (em get_session)
+    e operações de leitura idempotentes (em execute_with_retry). Uma falha no
+    meio de uma escrita é propagada para quem chamou.
+    """
     
-    @contextmanager
-    def get_session(self):
-        """Context manager para sessões com retry logic"""
-        session = None
+    def __init__(self, fabrica_sessao=None, max_retries: int = DB_MAX_TENTATIVAS,
+                 retry_delay: float = DB_ESPERA_TENTATIVA):
+        self.fabrica_sessao = fabrica_sessao
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _nova_sessao(self):
+        if self.fabrica_sessao is None:
+            get_engine()
+            return _session_local()
+        return self.fabrica_sessao()
+
+    def _esperar(self, attempt: int):
+        espera = self.retry_delay * (2 ** attempt)  # Exponential backoff
+        logger.info(f"Tentando reconectar em {espera}s...")
+        time.sleep(espera)
+
+    def _abrir_sessao(self):
+        """Sessão já com conexão do pool; repete só a obtenção da conexão"""
         for attempt in range(self.max_retries):
+            session = self._nova_sessao()
             try:
-                session = SessionLocal()
-                yield session
-                session.commit()
-                break
-                
+                session.connection()
+                return session
             except (OperationalError, DisconnectionError) as e:
+                session.close()
                 logger.error(f"Erro de conexão (tentativa {attempt + 1}): {e}")
-                
-                if session:
-                    session.rollback()
-                    session.close()
-                    session = None
-                
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (2 ** attempt))  # Exponential backoff
-                    logger.info(f"Tentando reconectar em {self.retry_delay * (2 ** attempt)}s...")
-                else:
+                if attempt == self.max_retries - 1:
                     logger.error("Máximo de tentativas excedido")
-                    raise e
-                    
-            except Exception as e:
-                logger.error(f"Erro não relacionado à conexão: {e}")
-                if session:
-                    session.rollback()
-                raise e
-                
-            finally:
-                if session:
-                    session.close()
+                    raise
+                self._esperar(attempt)
+    
+    @contextmanager
+    def get_session(self):
+        """Context manager para sessões: commit no fim, rollback em erro.
+
+        Erros dentro do bloco não são repetidos (o corpo pode ter escrito algo);
+        para leituras que podem ser repetidas use execute_with_retry.
+        """
+        session = self._abrir_sessao()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
     
     def execute_with_retry(self, operation, *args, **kwargs):
-        """Executa operação com retry logic"""
+        """Executa `operation(session, *args, **kwargs)` repetindo em falha de conexão.
+
+        Só para leituras idempotentes: a operação inteira roda de novo numa sessão nova.
+        """
         for attempt in range(self.max_retries):
             try:
                 with self.get_session() as session:
                     return operation(session, *args, **kwargs)
                     
-            except (OperationalError, DisconnectionError) as e:
+            except Exception as e:
+                if not erro_de_conexao(e):
+                    raise
                 logger.error(f"Erro na operação (tentativa {attempt + 1}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    raise e
+                if attempt == self.max_retries - 1:
+                    raise
+                self._esperar(attempt)
     
     def test_connection(self) -> bool:
         """Testa se a conexão está funcionando"""
         try:
             with self.get_session() as session:
-                result = session.execute("SELECT 1").scalar()
+                result = session.execute(text("SELECT 1")).scalar()
                 return result == 1
         except Exception as e:
             logger.error(f"Teste de conexão falhou: {e}")
             return False
     
     def get_connection_info(self) -> dict:
-        """Retorna informações sobre o pool de conexões"""
+        """Retorna informações sobre o pool de conexões (vazio se o engine ainda não foi criado).
+
+        Com o engine assíncrono em uso, o pool dele aparece em 'async'.
+        """
         try:
-            pool = engine.pool
-            return {
-                'pool_size': pool.size(),
-                'checked_in': pool.checkedin(),
-                'checked_out': pool.checkedout(),
-                'overflow': pool.overflow(),
-                'invalid': pool.invalid()
-            }
+            info = _info_pool(_engine.pool) if _engine is not None else {}
+            if _async_engine is not None:
+                info['async'] = _info_pool(_async_engine.sync_engine.pool)
+            return info
         except Exception as e:
             logger.error(f"Erro ao obter info do pool: {e}")
             return {}
 
+def _info_pool(pool) -> dict:
+    return {
+        'pool_size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow()
+    }
+
 # Instância global do gerenciador
 db_manager = DatabaseManager()
 
@@ -185,9 +297,31 @@ def get_connection_info() -> dict:
     return db_manager.get_connection_info()
 
 def execute_with_retry(operation, *args, **kwargs):
-    """Executa operação com retry"""
+    """Executa leitura idempotente com retry em falha de conexão"""
     return db_manager.execute_with_retry(operation, *args, **kwargs)
 
+async def execute_with_retry_async(operation, *args, max_retries: int = DB_MAX_TENTATIVAS,
+                                   retry_delay: float = DB_ESPERA_TENTATIVA, **kwargs):
+    """Versão assíncrona de execute_with_retry: `await operation(conn, *args, **kwargs)`.
+
+    Também só para leituras idempotentes; repete a operação inteira numa
+    conexão nova quando a falha é de conexão.
+    """
+    for attempt in range(max_retries):
+        try:
+            async with get_async_engine().connect() as conn:
+                return await operation(conn, *args, **kwargs)
+
+        except Exception as e:
+            if not erro_de_conexao(e):
+                raise
+            logger.error(f"Erro na operação assíncrona (tentativa {attempt + 1}): {e}")
+            if attempt == max_retries - 1:
+                raise
+            espera = retry_delay * (2 ** attempt)
+            logger.info(f"Tentando reconectar em {espera}s...")
+            await asyncio.sleep(espera)
+
 # Dependência para FastAPI (se estiver usando)
 def get_db():
     """Dependência do FastAPI para injeção de sessão"""
@@ -199,7 +333,7 @@ def create_tables():
     """Cria todas as tabelas definidas nos models"""
     try:
         from models import Base  # Importe seus models aqui
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=get_engine())
         logger.info("✅ Tabelas criadas/verificadas com sucesso")
     except ImportError:
         logger.warning("⚠️  Arquivo models.py não encontrado")
@@ -221,7 +355,7 @@ if __name__ == "__main__":
         # Exemplo de uso da sessão
         def exemplo_query(session):
             # Substitua por uma query real do seu projeto
-            result = session.execute("SELECT current_database(), version()").fetchone()
+            result = session.execute(text("SELECT current_database(), version()")).fetchone()
             return result
         
         try:
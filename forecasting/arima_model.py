@@ -1,20 +1,27 @@
-from statsmodels.tsa.arima.model import ARIMA
-from sklearn.metrics import mean_squared_error
+from forecasting.backtest import BACKTEST_PASSO, backtest_estatistico, cortes_dobras
 import numpy as np
 
-def treinar_arima(serie):
-    # Exemplo básico: ordem (1,1,1) - você pode melhorar isso com autoescolha depois
-    modelo = ARIMA(serie, order=(1,1,1))
+def treinar_arima(serie, order=(1,1,1)):
+    # Ordem padrão (1,1,1); a busca automática em order_search pode fornecer outra
+    # (statsmodels importado só no primeiro ajuste, fora do caminho de import do app)
+    from statsmodels.tsa.arima.model import ARIMA
+    modelo = ARIMA(serie, order=order)
     return modelo
 
-def avaliar_arima(modelo, serie, horizon=15):
-    treino = serie[:-horizon]
-    teste = serie[-horizon:]
+def avaliar_arima(serie, horizon=15, order=(1,1,1), maxiter=None, dobras=1, passo=BACKTEST_PASSO, detalhado=False):
+    """Ajusta o ARIMA na janela de treino da primeira dobra e mede o RMSE médio das `dobras` origens.
+
+    Retorna (resultado_ajustado, rmse) para que o vencedor seja reaproveitado
+    sem um novo fit; em caso de falha retorna (None, inf). Com `detalhado` o
+    segundo item é o backtest completo (métricas por dobra e agregadas).
+    `maxiter` limita as iterações do otimizador (usado quando há prazo).
+    """
+    def ajustar(treino):
+        return treinar_arima(treino, order).fit(method_kwargs={"maxiter": maxiter} if maxiter else None)
 
     try:
-        fitted = modelo.fit()
-        preds = fitted.forecast(steps=horizon)
-        rmse = np.sqrt(mean_squared_error(teste, preds))
-        return rmse
+        cortes = cortes_dobras(len(serie), dobras, horizon, passo)
+        fitted, resultado = backtest_estatistico(serie, ajustar, cortes, horizon)
     except Exception:
-        return np.inf
+        return None, ({"dobras": [], "agregado": {}} if detalhado else np.inf)
+    return fitted, (resultado if detalhado else resultado["agregado"]["rmse"])
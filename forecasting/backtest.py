@@ -0,0 +1,164 @@
+# Backtest com origem móvel (rolling origin): várias dobras de treino/teste deslizando no fim da série.
+# Na seleção, cada candidato estatístico é ajustado uma vez na janela da primeira dobra e os mesmos
+# parâmetros são levados às dobras seguintes com `extend` (só filtra os dias novos). No relatório
+# offline as dobras podem ser reajustadas do zero, em paralelo num pool de processos.
+#
+# Uso:
+#   python -m forecasting.backtest --tipo receita --dobras 5 --horizon 15 --passo 7 [--reajustar] [--saida rel.json]
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from forecasting.baseline_model import BASELINES, avaliar_baselines
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_DOBRAS = int(os.getenv("BACKTEST_DOBRAS", "3"))
+BACKTEST_PASSO = int(os.getenv("BACKTEST_PASSO", "7"))
+
+
+def cortes_dobras(n: int, dobras: int = BACKTEST_DOBRAS, horizon: int = 15, passo: int = BACKTEST_PASSO) -> list:
+    """Índices onde começa o teste de cada dobra, do mais antigo ao mais recente.
+
+    A última dobra testa os últimos `horizon` dias; as anteriores recuam `passo`
+    dias cada. Dobras que deixariam menos de 2*horizon dias de treino são descartadas.
+    """
+    cortes = [n - horizon - passo * k for k in reversed(range(max(1, dobras)))]
+    validos = [c for c in cortes if c >= 2 * horizon]
+    return validos or [max(1, n - horizon)]
+
+
+def metricas(reais, previstos) -> dict:
+    """RMSE, MAE e MAPE (o MAPE ignora os dias com valor real zero)"""
+    reais = np.asarray(reais, dtype="float64")
+    erros = reais - np.asarray(previstos, dtype="float64")
+    nao_zero = reais != 0
+    return {
+        "rmse": float(np.sqrt(np.mean(erros ** 2))),
+        "mae": float(np.mean(np.abs(erros))),
+        "mape": float(np.mean(np.abs(erros[nao_zero] / reais[nao_zero]))) if nao_zero.any() else float("nan")
+    }
+
+
+def agregar(dobras: list) -> dict:
+    """Média das métricas por dobra"""
+    return {m: float(np.nanmean([d[m] for d in dobras])) for m in ("rmse", "mae", "mape")} if dobras else {}
+
+
+def backtest_baselines_matriz(matriz, cortes: list, horizon: int) -> dict:
+    """RMSE médio nas dobras de cada baseline para cada linha da matriz: {nome: vetor (n_series,)}"""
+    matriz = np.atleast_2d(np.asarray(matriz, dtype="float64"))
+    por_dobra = [avaliar_baselines(matriz[:, :corte + horizon], horizon) for corte in cortes]
+    return {nome: np.mean([d[nome] for d in por_dobra], axis=0) for nome in BASELINES}
+
+
+def backtest_baselines(serie, cortes: list, horizon: int) -> dict:
+    """RMSE agregado de todas as baselines nas dobras (vetorizado entre baselines em cada dobra)"""
+    return {nome: float(rmse[0]) for nome, rmse in backtest_baselines_matriz(serie, cortes, horizon).items()}
+
+
+def backtest_estatistico(serie, ajustar, cortes: list, horizon: int):
+    """Ajusta uma vez na janela de treino da primeira dobra e estende o resultado pelas seguintes.
+
+    `ajustar(treino)` devolve um resultado do statsmodels. Retorna
+    (resultado_da_primeira_janela, {"dobras": [...], "agregado": {...}}).
+    """
+    fit = ajustar(serie[:cortes[0]])
+    atual = fit
+    dobras = []
+    for i, corte in enumerate(cortes):
+        if i > 0:
+            # Mesmos parâmetros; só os dias entre as duas origens passam pelo filtro
+            atual = atual.extend(serie[cortes[i - 1]:corte])
+        preds = np.asarray(atual.forecast(steps=horizon))
+        dobras.append({"origem": str(serie.index[corte]), **metricas(serie.to_numpy()[corte:corte + horizon], preds)})
+    return fit, {"dobras": dobras, "agregado": agregar(dobras)}
+
+
+def _dobra_reajustada(args):
+    """Reajusta um candidato do zero numa dobra (roda nos processos do pool)"""
+    from forecasting.model_selector import avaliar_candidato
+
+    nome, valores, inicio, corte, horizon = args
+    serie = pd.Series(valores[:corte + horizon], index=pd.date_range(inicio, periods=corte + horizon, freq="D"))
+    if nome in BASELINES:
+        preds = BASELINES[nome](valores[:corte], horizon)[0]
+    else:
+        fit, _ = avaliar_candidato(nome, serie, horizon, dobras=1)
+        if fit is None:
+            return {"origem": str(serie.index[corte]), "rmse": np.inf, "mae": np.inf, "mape": np.inf}
+        preds = np.asarray(fit.forecast(steps=horizon))
+    return {"origem": str(serie.index[corte]), **metricas(valores[corte:corte + horizon], preds)}
+
+
+def relatorio(serie, dobras: int = BACKTEST_DOBRAS, horizon: int = 15, passo: int = BACKTEST_PASSO,
+              reajustar: bool = False, workers: int = None) -> dict:
+    """Backtest de todos os candidatos; com `reajustar` cada (candidato, dobra) é ajustado do zero em paralelo"""
+    from forecasting.model_selector import avaliar_candidato
+
+    cortes = cortes_dobras(len(serie), dobras, horizon, passo)
+    candidatos = list(BASELINES) + ["ARIMA", "SARIMA"]
+    resultado = {"cortes": [str(serie.index[c]) for c in cortes], "candidatos": {}}
+
+    if reajustar:
+        valores = serie.to_numpy(dtype="float64")
+        tarefas = [(nome, valores, serie.index[0], corte, horizon) for nome in candidatos for corte in cortes]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            por_tarefa = list(pool.map(_dobra_reajustada, tarefas))
+        for i, nome in enumerate(candidatos):
+            dobras_nome = por_tarefa[i * len(cortes):(i + 1) * len(cortes)]
+            resultado["candidatos"][nome] = {"dobras": dobras_nome, "agregado": agregar(dobras_nome)}
+        return resultado
+
+    for nome in candidatos:
+        if nome in BASELINES:
+            dobras_nome = [
+                {"origem": str(serie.index[c]),
+                 **metricas(serie.to_numpy()[c:c + horizon], BASELINES[nome](serie.to_numpy()[:c], horizon)[0])}
+                for c in cortes
+            ]
+            resultado["candidatos"][nome] = {"dobras": dobras_nome, "agregado": agregar(dobras_nome)}
+        else:
+            _, resultado["candidatos"][nome] = avaliar_candidato(nome, serie, horizon, detalhado=True,
+                                                                 dobras=dobras, passo=passo)
+    return resultado
+
+
+def main(argv=None):
+    from forecasting.forecasting_service import carregar_dados_transacao
+
+    parser = argparse.ArgumentParser(description="Backtest com origem móvel dos modelos de previsão")
+    parser.add_argument("--tipo", default="receita", choices=["receita", "despesa"])
+    parser.add_argument("--id-usuario", type=int)
+    parser.add_argument("--dobras", type=int, default=BACKTEST_DOBRAS)
+    parser.add_argument("--horizon", type=int, default=15)
+    parser.add_argument("--passo", type=int, default=BACKTEST_PASSO)
+    parser.add_argument("--reajustar", action="store_true", help="reajusta cada dobra do zero, em paralelo")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--saida", help="arquivo JSON com o relatório")
+    args = parser.parse_args(argv)
+
+    df = carregar_dados_transacao(tipo=args.tipo, id_usuario=args.id_usuario)
+    if df.empty:
+        print("❌ Nenhum dado para o backtest")
+        return
+
+    rel = relatorio(df["valor"], args.dobras, args.horizon, args.passo, args.reajustar, args.workers)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(rel, f, ensure_ascii=False, indent=2)
+
+    print(f"Origens: {', '.join(rel['cortes'])}")
+    print(f"{'modelo':<18}{'RMSE':>12}{'MAE':>12}{'MAPE':>10}")
+    for nome, r in sorted(rel["candidatos"].items(), key=lambda item: item[1]["agregado"].get("rmse", np.inf)):
+        ag = r["agregado"]
+        print(f"{nome:<18}{ag.get('rmse', np.nan):>12.2f}{ag.get('mae', np.nan):>12.2f}{ag.get('mape', np.nan):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# Modelos de base baratos, vetorizados em NumPy.
+# Todas as funções recebem uma matriz (n_series, n_dias) -- ou um vetor, tratado como uma série --
+# e calculam as previsões de todas as séries de uma vez, sem laço em Python por série.
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+
+def _como_matriz(valores):
+    matriz = np.asarray(valores, dtype="float64")
+    return matriz[np.newaxis, :] if matriz.ndim == 1 else matriz
+
+
+def prever_sazonal_ingenuo(valores, passos: int, periodo: int = 7):
+    """Repete o último ciclo de `periodo` dias"""
+    matriz = _como_matriz(valores)
+    periodo = min(periodo, matriz.shape[1])
+    ultimo_ciclo = matriz[:, -periodo:]
+    return np.tile(ultimo_ciclo, (1, -(-passos // periodo)))[:, :passos]
+
+
+def prever_media_movel(valores, passos: int, janela: int = 7):
+    """Média dos últimos `janela` dias, repetida no horizonte"""
+    matriz = _como_matriz(valores)
+    media = matriz[:, -janela:].mean(axis=1, keepdims=True)
+    return np.repeat(media, passos, axis=1)
+
+
+def _nivel_ses(matriz, alpha: float):
+    """Nível final da suavização exponencial simples, como soma ponderada (sem recursão)"""
+    n = matriz.shape[1]
+    # nível_T = alpha * sum((1-alpha)^k * y_{T-k}) + (1-alpha)^T * y_0 (nível inicial = y_0)
+    pesos = alpha * (1 - alpha) ** np.arange(n)
+    return matriz[:, ::-1] @ pesos + (1 - alpha) ** n * matriz[:, 0]
+
+
+def prever_ses(valores, passos: int, alpha: float = 0.3):
+    """Suavização exponencial simples: previsão plana no último nível"""
+    matriz = _como_matriz(valores)
+    return np.repeat(_nivel_ses(matriz, alpha)[:, np.newaxis], passos, axis=1)
+
+
+def prever_holt(valores, passos: int, alpha: float = 0.3, beta: float = 0.1):
+    """Holt (nível + tendência linear); a recursão anda no tempo com todas as séries juntas"""
+    matriz = _como_matriz(valores)
+    nivel = matriz[:, 0].copy()
+    tendencia = (matriz[:, 1] - matriz[:, 0]) if matriz.shape[1] > 1 else np.zeros(matriz.shape[0])
+    for t in range(1, matriz.shape[1]):
+        anterior = nivel
+        nivel = alpha * matriz[:, t] + (1 - alpha) * (nivel + tendencia)
+        tendencia = beta * (nivel - anterior) + (1 - beta) * tendencia
+    return nivel[:, np.newaxis] + tendencia[:, np.newaxis] * np.arange(1, passos + 1)
+
+
+BASELINES = {
+    "SAZONAL_INGENUO": prever_sazonal_ingenuo,
+    "MEDIA_MOVEL": prever_media_movel,
+    "SES": prever_ses,
+    "HOLT": prever_holt,
+}
+
+
+def _residuos_sazonal(matriz, periodo: int = 7):
+    return matriz[:, periodo:] - matriz[:, :-periodo]
+
+
+def _residuos_media_movel(matriz, janela: int = 7):
+    acumulado = np.cumsum(np.pad(matriz, ((0, 0), (1, 0))), axis=1)
+    medias = (acumulado[:, janela:-1] - acumulado[:, :-janela - 1]) / janela
+    return matriz[:, janela:] - medias
+
+
+def _residuos_ses(matriz, alpha: float = 0.3):
+    # nível_t = alpha*y_t + (1-alpha)*nível_{t-1} como filtro IIR, todas as séries de uma vez
+    from scipy.signal import lfilter
+
+    niveis, _ = lfilter([alpha], [1, alpha - 1], matriz[:, 1:], axis=1, zi=(1 - alpha) * matriz[:, :1])
+    return matriz[:, 1:] - np.concatenate([matriz[:, :1], niveis[:, :-1]], axis=1)
+
+
+def _residuos_holt(matriz, alpha: float = 0.3, beta: float = 0.1):
+    nivel = matriz[:, 0].copy()
+    tendencia = (matriz[:, 1] - matriz[:, 0]) if matriz.shape[1] > 1 else np.zeros(matriz.shape[0])
+    residuos = np.empty((matriz.shape[0], matriz.shape[1] - 1))
+    for t in range(1, matriz.shape[1]):
+        residuos[:, t - 1] = matriz[:, t] - (nivel + tendencia)
+        anterior = nivel
+        nivel = alpha * matriz[:, t] + (1 - alpha) * (nivel + tendencia)
+        tendencia = beta * (nivel - anterior) + (1 - beta) * tendencia
+    return residuos
+
+
+# Erros de previsão um passo à frente de cada baseline dentro da própria série
+RESIDUOS = {
+    "SAZONAL_INGENUO": _residuos_sazonal,
+    "MEDIA_MOVEL": _residuos_media_movel,
+    "SES": _residuos_ses,
+    "HOLT": _residuos_holt,
+}
+
+
+def intervalos_baseline(nome: str, valores, passos: int, niveis=(0.8, 0.95), previsao=None):
+    """Intervalos de previsão pelos quantis dos resíduos um passo à frente.
+
+    A largura cresce com sqrt(h) no horizonte. Retorna {nivel: (inferior, superior)},
+    cada um (n_series, passos); sem resíduos suficientes os limites são NaN.
+    """
+    matriz = _como_matriz(valores)
+    if previsao is None:
+        previsao = BASELINES[nome](matriz, passos)
+    residuos = RESIDUOS[nome](matriz) if matriz.shape[1] > 8 else np.empty((matriz.shape[0], 0))
+    niveis = np.asarray(niveis, dtype="float64")
+    if residuos.shape[1] < 2:
+        vazio = np.full_like(previsao, np.nan)
+        return {float(nivel): (vazio, vazio) for nivel in niveis}
+
+    # (2, n_niveis, n_series): quantis inferior e superior de cada nível
+    quantis = np.quantile(residuos, np.stack([(1 - niveis) / 2, (1 + niveis) / 2]), axis=1)
+    escala = np.sqrt(np.arange(1, passos + 1))
+    return {
+        float(nivel): (previsao + quantis[0, i][:, np.newaxis] * escala,
+                       previsao + quantis[1, i][:, np.newaxis] * escala)
+        for i, nivel in enumerate(niveis)
+    }
+
+
+def rmse_linhas(reais, previstos):
+    """RMSE de cada linha"""
+    return np.sqrt(np.mean((np.asarray(reais) - np.asarray(previstos)) ** 2, axis=-1))
+
+
+def avaliar_baselines(valores, horizon: int = 15):
+    """RMSE de holdout de cada baseline para todas as séries.
+
+    Retorna {nome: vetor de RMSE (n_series,)} usando os últimos `horizon` dias como teste.
+    """
+    matriz = _como_matriz(valores)
+    if matriz.shape[1] <= horizon:
+        # Sem janela de treino: nenhuma baseline tem como ser avaliada
+        return {nome: np.full(matriz.shape[0], np.inf) for nome in BASELINES}
+    treino, teste = matriz[:, :-horizon], matriz[:, -horizon:]
+    return {nome: rmse_linhas(teste, funcao(treino, horizon)) for nome, funcao in BASELINES.items()}
+
+
+def prever_melhor_baseline(valores, passos: int, horizon: int = 15, scores=None):
+    """Para cada série escolhe a baseline de menor RMSE no holdout e prevê com ela na série toda.
+
+    `scores` ({nome: vetor (n_series,)}) substitui o holdout, por exemplo pelo backtest
+    com origem móvel. Retorna (nomes (n_series,), rmse (n_series,), previsoes (n_series, passos)).
+    """
+    matriz = _como_matriz(valores)
+    scores = avaliar_baselines(matriz, horizon) if scores is None else scores
+    nomes = np.array(list(scores))
+    tabela = np.vstack([scores[n] for n in nomes])            # (n_baselines, n_series)
+    melhor = np.argmin(tabela, axis=0)
+
+    previsoes = np.stack([BASELINES[n](matriz, passos) for n in nomes])  # (n_baselines, n_series, passos)
+    linhas = np.arange(matriz.shape[0])
+    return nomes[melhor], tabela[melhor, linhas], previsoes[melhor, linhas]
+
+
+class ModeloBaseline:
+    """Baseline de uma série com a mesma interface usada por prever() e pela atualização incremental"""
+
+    def __init__(self, nome: str, serie):
+        self.nome = nome
+        self.serie = serie
+        self.nobs = len(serie)
+        # prever() usa modelo.data.dates para datar a previsão, como nos resultados do statsmodels
+        self.data = SimpleNamespace(dates=serie.index)
+
+    def forecast(self, steps: int = 1):
+        return BASELINES[self.nome](self.serie.to_numpy(dtype="float64"), steps)[0]
+
+    def intervalos(self, steps: int, niveis=(0.8, 0.95)):
+        """{nivel: (inferior, superior)} pelos quantis dos resíduos (ver intervalos_baseline)"""
+        limites = intervalos_baseline(self.nome, self.serie.to_numpy(dtype="float64"), steps, niveis)
+        return {nivel: (inferior[0], superior[0]) for nivel, (inferior, superior) in limites.items()}
+
+    def append(self, novos):
+        return ModeloBaseline(self.nome, pd.concat([self.serie, novos]))
+
+    def apply(self, serie):
+        return ModeloBaseline(self.nome, serie)
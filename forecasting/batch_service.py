@@ -0,0 +1,249 @@
+# Previsão em lote para muitos usuários numa passada só:
+# uma consulta agrupada por (id_usuario, dia), uma matriz 2-D com as séries de todos os usuários,
+# baselines vetorizadas (usuários com o mesmo primeiro dia juntos) e seleção ARIMA/SARIMA em paralelo
+# num pool de processos. Baselines e statsmodels são pontuados no mesmo backtest com origem móvel.
+#
+# Uso:
+#   python -m forecasting.batch_service --tipo receita --usuarios 1,2,3 --saida previsoes.json
+#   python -m forecasting.batch_service --todos --tabela previsoes_lote
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from database import execute_with_retry, get_session
+from forecasting.backtest import BACKTEST_DOBRAS, BACKTEST_PASSO, backtest_baselines_matriz, cortes_dobras
+from forecasting.baseline_model import prever_melhor_baseline
+from forecasting.forecasting_service import expr_dia_sql, prever
+from forecasting.model_selector import selecionar_melhor_modelo
+
+logger = logging.getLogger(__name__)
+
+LOTE_WORKERS = int(os.getenv("LOTE_WORKERS", os.cpu_count() or 1))
+# Séries com menos dias que isso ficam só com a baseline
+LOTE_MIN_DIAS = int(os.getenv("LOTE_MIN_DIAS", "30"))
+LOTE_HORIZON = 15
+
+# Nome da tabela de saída: identificador simples, opcionalmente com o esquema (vai direto no SQL)
+IDENTIFICADOR_TABELA = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?")
+
+
+def listar_usuarios() -> list:
+    """Todos os usuários com alguma venda"""
+    linhas = execute_with_retry(lambda session: session.execute(text(
+        "SELECT DISTINCT id_usuario FROM vendas WHERE id_usuario IS NOT NULL ORDER BY id_usuario"
+    )).scalars().all())
+    return list(linhas)
+
+
+def carregar_series_usuarios(ids_usuario, tipo: str = "receita", desde=None, ate=None):
+    """Séries diárias de vários usuários numa única consulta agrupada.
+
+    Retorna (ids (n,), datas (DatetimeIndex com m dias), matriz (n, m)); usuários
+    sem transação ficam com linha de zeros. O vínculo usuário-transação é o mesmo
+    do carregar_dados_transacao (produto vendido pelo usuário), sem multiplicar linhas.
+    """
+    ids = np.asarray(sorted(set(ids_usuario)), dtype="int64")
+    clauses = ["t.tipo = :tipo"]
+    params = {"tipo": tipo, "ids": ids.tolist()}
+
+    if desde is not None:
+        clauses.append("t.data >= :desde")
+        params["desde"] = pd.Timestamp(desde).to_pydatetime()
+    if ate is not None:
+        clauses.append("t.data < :ate")
+        params["ate"] = (pd.Timestamp(ate).normalize() + pd.Timedelta(days=1)).to_pydatetime()
+
+    def consultar(session):
+        conn = session.connection()
+        dia = expr_dia_sql(conn.dialect.name)
+        query = text(f"""
+            SELECT u.id_usuario, {dia} AS data, CAST(SUM(t.valor) AS DOUBLE PRECISION) AS valor
+            FROM transacoes t
+            JOIN produtos p ON t."produtoId" = p.id
+            JOIN (
+                SELECT DISTINCT iv.id_produto, v.id_usuario
+                FROM itens_venda iv
+                JOIN vendas v ON iv.id_venda = v.id
+                WHERE v.id_usuario IN :ids
+            ) u ON u.id_produto = t."produtoId"
+            WHERE {" AND ".join(clauses)}
+            GROUP BY u.id_usuario, {dia}
+        """).bindparams(bindparam("ids", expanding=True))
+        return pd.read_sql(sql=query, con=conn, params=params, dtype={"valor": "float64"})
+
+    df = execute_with_retry(consultar)
+
+    if df.empty:
+        return ids, pd.DatetimeIndex([]), np.zeros((len(ids), 0))
+
+    datas_linha = pd.DatetimeIndex(pd.to_datetime(df["data"]))
+    if datas_linha.tz is not None:
+        datas_linha = datas_linha.tz_localize(None)
+    datas = pd.date_range(datas_linha.min(), datas_linha.max(), freq="D")
+
+    # Preenche a matriz por índice, sem pivot nem laço por usuário
+    matriz = np.zeros((len(ids), len(datas)))
+    linhas = np.searchsorted(ids, df["id_usuario"].to_numpy(dtype="int64"))
+    colunas = ((datas_linha - datas[0]) // pd.Timedelta(days=1)).to_numpy()
+    np.add.at(matriz, (linhas, colunas), df["valor"].to_numpy())
+    return ids, datas, matriz
+
+
+def _baselines_por_inicio(matriz, primeiro, periodo: int):
+    """Melhor baseline de cada usuário, avaliada só a partir da primeira transação dele.
+
+    Usa o mesmo backtest da seleção (horizon e dobras de preparar_selecao). Usuários
+    com o mesmo primeiro dia têm linhas do mesmo tamanho e são avaliados juntos.
+    Retorna (nomes, rmse, previsoes) alinhados às linhas da matriz.
+    """
+    nomes = np.empty(matriz.shape[0], dtype=object)
+    rmse = np.full(matriz.shape[0], np.inf)
+    previsoes = np.zeros((matriz.shape[0], periodo))
+    for inicio in np.unique(primeiro[primeiro < matriz.shape[1]]):
+        linhas = np.flatnonzero(primeiro == inicio)
+        sub = matriz[linhas, inicio:]
+        horizon = min(LOTE_HORIZON, max(1, sub.shape[1] // 3))
+        cortes = cortes_dobras(sub.shape[1], BACKTEST_DOBRAS, horizon, BACKTEST_PASSO)
+        nomes[linhas], rmse[linhas], previsoes[linhas] = prever_melhor_baseline(
+            sub, periodo, horizon, backtest_baselines_matriz(sub, cortes, horizon)
+        )
+    return nomes, rmse, previsoes
+
+
+def _ajustar_serie(args):
+    """Seleção ARIMA/SARIMA de uma série (roda nos processos do pool)"""
+    valores, inicio, periodo = args
+    serie = pd.Series(valores, index=pd.date_range(inicio, periods=len(valores), freq="D"))
+    try:
+        modelo, nome, scores = selecionar_melhor_modelo(serie, LOTE_HORIZON)
+        previsao = prever(modelo, periodo)
+        return nome, float(scores[nome]), previsao["previsao"].to_numpy(dtype="float64")
+    except Exception as e:
+        logger.warning(f"Falha no ajuste em lote: {e}")
+        return None
+
+
+def prever_lote(ids_usuario, tipo: str = "receita", periodo: int = 7, workers: int = LOTE_WORKERS,
+                desde=None, ate=None) -> dict:
+    """Previsão para vários usuários; retorna {"resultados": [...], "estatisticas": {...}}"""
+    inicio = time.perf_counter()
+    ids, datas, matriz = carregar_series_usuarios(ids_usuario, tipo, desde, ate)
+    tempo_carga = time.perf_counter() - inicio
+
+    resultados = []
+    if matriz.shape[1] == 0:
+        return {"resultados": resultados, "estatisticas": {"usuarios": 0}}
+
+    # Descarta os dias antes da primeira transação de cada usuário (zeros ali não são dados)
+    tem_valor = matriz != 0
+    primeiro = np.where(tem_valor.any(axis=1), tem_valor.argmax(axis=1), matriz.shape[1])
+
+    # Baselines: resultado das séries curtas e fallback quando o ajuste falha
+    nomes_base, rmse_base, prev_base = _baselines_por_inicio(matriz, primeiro, periodo)
+    elegiveis = np.flatnonzero(matriz.shape[1] - primeiro >= LOTE_MIN_DIAS)
+
+    tarefas = [(matriz[i, primeiro[i]:], datas[primeiro[i]], periodo) for i in elegiveis]
+    ajustes = {}
+    if tarefas:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            chunk = max(1, len(tarefas) // (max(1, workers) * 4))
+            ajustes = dict(zip(elegiveis, pool.map(_ajustar_serie, tarefas, chunksize=chunk)))
+
+    datas_previsao = pd.date_range(datas[-1] + pd.Timedelta(days=1), periods=periodo).strftime("%Y-%m-%d").tolist()
+    for i, id_usuario in enumerate(ids):
+        if not tem_valor[i].any():
+            continue
+        nome, rmse, previsao = str(nomes_base[i]), float(rmse_base[i]), prev_base[i]
+        ajuste = ajustes.get(i)
+        if ajuste is not None:
+            # A seleção já comparou as baselines com ARIMA/SARIMA nas mesmas dobras
+            nome, rmse, previsao = ajuste
+        resultados.append({
+            "id_usuario": int(id_usuario),
+            "tipo": tipo,
+            "modelo": nome,
+            "rmse": rmse,
+            "datas": datas_previsao,
+            "previsao": np.round(previsao, 2).tolist()
+        })
+
+    duracao = time.perf_counter() - inicio
+    estatisticas = {
+        "usuarios": len(resultados),
+        "ajustados": len(tarefas),
+        "segundos": duracao,
+        "segundos_carga": tempo_carga,
+        "usuarios_por_segundo": len(resultados) / duracao if duracao else 0.0
+    }
+    logger.info(f"Lote: {estatisticas}")
+    return {"resultados": resultados, "estatisticas": estatisticas}
+
+
+def gravar_resultados_json(resultados, caminho: str):
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False)
+
+
+def validar_tabela(tabela: str) -> str:
+    """Nome da tabela se for um identificador SQL simples (ou esquema.tabela); senão ValueError"""
+    if not IDENTIFICADOR_TABELA.fullmatch(tabela):
+        raise ValueError(f"Nome de tabela inválido: {tabela!r}")
+    return tabela
+
+
+def gravar_resultados_banco(resultados, tabela: str = "previsoes_lote"):
+    """Grava todas as linhas de previsão num único executemany"""
+    # O nome da tabela não pode ser parâmetro da consulta, então entra no SQL só depois de validado
+    validar_tabela(tabela)
+    linhas = [
+        {"id_usuario": r["id_usuario"], "tipo": r["tipo"], "data": d, "previsao": v, "modelo": r["modelo"]}
+        for r in resultados
+        for d, v in zip(r["datas"], r["previsao"])
+    ]
+    if not linhas:
+        return
+    with get_session() as session:
+        session.execute(
+            text(f"INSERT INTO {tabela} (id_usuario, tipo, data, previsao, modelo)"
+                 " VALUES (:id_usuario, :tipo, :data, :previsao, :modelo)"),
+            linhas
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Previsão em lote para vários usuários")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--usuarios", help="ids separados por vírgula")
+    grupo.add_argument("--todos", action="store_true", help="todos os usuários com vendas")
+    parser.add_argument("--tipo", default="receita", choices=["receita", "despesa"])
+    parser.add_argument("--periodo", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=LOTE_WORKERS)
+    parser.add_argument("--desde")
+    parser.add_argument("--ate")
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    parser.add_argument("--tabela", type=validar_tabela, help="tabela onde gravar as previsões")
+    args = parser.parse_args(argv)
+
+    ids = listar_usuarios() if args.todos else [int(i) for i in args.usuarios.split(",") if i.strip()]
+    lote = prever_lote(ids, args.tipo, args.periodo, args.workers, args.desde, args.ate)
+
+    if args.saida:
+        gravar_resultados_json(lote["resultados"], args.saida)
+    if args.tabela:
+        gravar_resultados_banco(lote["resultados"], args.tabela)
+
+    est = lote["estatisticas"]
+    print(f"✅ {est['usuarios']} usuários em {est.get('segundos', 0):.2f}s "
+          f"({est.get('usuarios_por_segundo', 0):.1f} usuários/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Coalescência de chamadas concorrentes idênticas (single-flight).
+# Quem chega enquanto já existe uma execução para a mesma chave aguarda essa execução e recebe
+# o mesmo resultado (ou a mesma exceção). Cancelar um dos aguardando não cancela a execução.
+import asyncio
+
+
+class Coalescedor:
+    """Uma execução em voo por chave, compartilhada por todos os chamadores"""
+
+    def __init__(self):
+        self._em_voo = {}  # chave -> Task
+        self.execucoes = 0
+        self.compartilhadas = 0
+
+    def executar(self, chave, fabrica, *args, **kwargs) -> asyncio.Future:
+        """Aguardável com o resultado de `fabrica(*args, **kwargs)` para a chave"""
+        tarefa = self._em_voo.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(fabrica(*args, **kwargs))
+            self._em_voo[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+            self.execucoes += 1
+        else:
+            self.compartilhadas += 1
+        return asyncio.shield(tarefa)
+
+    def _finalizar(self, chave, tarefa):
+        if self._em_voo.get(chave) is tarefa:
+            del self._em_voo[chave]
+        # Marca a exceção como lida: os aguardando já a recebem pelo shield
+        if not tarefa.cancelled():
+            tarefa.exception()
+
+    def em_andamento(self, chave) -> bool:
+        return chave in self._em_voo
+
+    def chaves(self) -> list:
+        return list(self._em_voo)
+
+    def estatisticas(self) -> dict:
+        return {
+            'em_voo': len(self._em_voo),
+            'execucoes': self.execucoes,
+            'compartilhadas': self.compartilhadas
+        }
@@ -0,0 +1,127 @@
+# Base dos armazéns locais em disco (modelos ajustados e snapshots de transações): um arquivo por
+# chave, nome começando pelo prefixo da chave, índice em memória montado na primeira listagem do
+# diretório e despejo do arquivo mais antigo quando o total passa do limite.
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ArmazemDisco:
+    """Um arquivo por chave em `diretorio`, com limite de tamanho e despejo do mais antigo.
+
+    As subclasses definem a extensão, como ler o nome do arquivo (`_ler_nome`) e o
+    formato do registro. Cada entrada do índice é (caminho, tamanho, mtime, *extra),
+    onde `extra` vem do nome do arquivo.
+    """
+
+    extensao = ""
+    descricao = "Armazém"
+    rotulo_registros = "registros"
+
+    def __init__(self, diretorio: str, max_bytes: int, banco: str = None):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        # Identidade do banco (URL sem a senha), que entra na chave: outro banco no mesmo diretório
+        # não enxerga estes arquivos. None = a URL configurada, resolvida no primeiro uso.
+        self.banco = banco
+        self._indice = None  # prefixo da chave -> (caminho, tamanho, mtime, *extra)
+        self._lock = threading.Lock()
+        self.despejos = 0
+
+    def _prefixo(self, chave) -> str:
+        if self.banco is None:
+            from sqlalchemy.engine import make_url
+            from database import montar_database_url
+            self.banco = make_url(montar_database_url()).render_as_string(hide_password=True)
+        return hashlib.blake2b(repr((self.banco, chave)).encode(), digest_size=8).hexdigest()
+
+    def _ler_nome(self, nome: str) -> tuple:
+        """(prefixo, *extra) a partir do nome do arquivo; ValueError se não for um arquivo do armazém"""
+        raise NotImplementedError
+
+    def _carregar_indice(self):
+        if self._indice is not None:
+            return
+        self._indice = {}
+        if not os.path.isdir(self.diretorio):
+            return
+        for entrada in os.scandir(self.diretorio):
+            if not entrada.name.endswith(self.extensao):
+                continue
+            try:
+                prefixo, *extra = self._ler_nome(entrada.name)
+            except ValueError:
+                continue
+            info = entrada.stat()
+            atual = self._indice.get(prefixo)
+            if atual is None or info.st_mtime > atual[2]:
+                self._indice[prefixo] = (entrada.path, info.st_size, info.st_mtime, *extra)
+        logger.info(f"{self.descricao}: {len(self._indice)} {self.rotulo_registros} em {self.diretorio}")
+
+    def _entrada(self, prefixo):
+        """Entrada do índice para o prefixo, ou None"""
+        with self._lock:
+            self._carregar_indice()
+            return self._indice.get(prefixo)
+
+    def _gravar(self, caminho: str, escrever):
+        """Grava via arquivo temporário + rename: quem lê nunca vê um arquivo pela metade"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            escrever(f)
+        os.replace(temporario, caminho)
+
+    def _registrar(self, prefixo, caminho: str, *extra):
+        """Põe o arquivo recém-gravado no índice, remove o anterior da chave e despeja o excesso"""
+        with self._lock:
+            self._carregar_indice()
+            anterior = self._indice.get(prefixo)
+            if anterior is not None and anterior[0] != caminho:
+                self._remover_arquivo(anterior[0])
+            self._indice[prefixo] = (caminho, os.path.getsize(caminho), time.time(), *extra)
+            self._despejar()
+
+    def _despejar(self):
+        # Remove os arquivos mais antigos até caber no limite
+        total = sum(item[1] for item in self._indice.values())
+        for prefixo, (caminho, tamanho, *_) in sorted(self._indice.items(), key=lambda item: item[1][2]):
+            if total <= self.max_bytes:
+                break
+            self._remover_arquivo(caminho)
+            del self._indice[prefixo]
+            total -= tamanho
+            self.despejos += 1
+
+    def _apagar(self, prefixo):
+        with self._lock:
+            item = self._indice.pop(prefixo, None)
+        if item is not None:
+            self._remover_arquivo(item[0])
+
+    @staticmethod
+    def _remover_arquivo(caminho):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+    def _contadores(self) -> dict:
+        """Contadores próprios da subclasse, incluídos em estatisticas()"""
+        return {}
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            self._carregar_indice()
+            return {
+                'diretorio': self.diretorio,
+                self.rotulo_registros: len(self._indice),
+                'bytes': sum(item[1] for item in self._indice.values()),
+                'max_bytes': self.max_bytes,
+                **self._contadores(),
+                'despejos': self.despejos
+            }
@@ -0,0 +1,217 @@
+# Executor dos ajustes de modelo (statsmodels), fora do event loop e do threadpool do uvicorn.
+# Os fits seguram o GIL quase o tempo todo, então cada um roda num processo descartável (morto se
+# passar do prazo), no máximo FIT_WORKERS ao mesmo tempo e com fila limitada: quando a fila enche
+# a chamada falha na hora (FilaCheiaError -> 503) em vez de empilhar requisições.
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# "process" (padrão) ou "thread" (útil em desenvolvimento/depuração; sem processo, o prazo não interrompe o ajuste)
+FIT_EXECUTOR = os.getenv("FIT_EXECUTOR", "process")
+FIT_WORKERS = int(os.getenv("FIT_WORKERS", os.cpu_count() or 1))
+# Quantos ajustes podem esperar na fila além dos que já estão rodando
+FIT_MAX_FILA = int(os.getenv("FIT_MAX_FILA", FIT_WORKERS * 2))
+# Valor sugerido no header Retry-After quando a fila está cheia (segundos)
+FIT_RETRY_AFTER = int(os.getenv("FIT_RETRY_AFTER", "5"))
+# Contexto dos processos descartáveis usados nos ajustes com prazo. O forkserver evita fork de um
+# processo com threads e, com o preload, os filhos já nascem com o statsmodels importado.
+FIT_MP_CONTEXTO = os.getenv(
+    "FIT_MP_CONTEXTO", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Os módulos do statsmodels são importados sob demanda, então o preload os carrega explicitamente
+FIT_PRELOAD = [
+    "forecasting.model_selector",
+    "statsmodels.tsa.arima.model",
+    "statsmodels.tsa.statespace.sarimax",
+]
+
+
+class FilaCheiaError(RuntimeError):
+    """Fila de ajustes cheia; o cliente deve tentar de novo depois de `retry_after` segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Fila de ajustes de modelo cheia, tente novamente mais tarde")
+        self.retry_after = retry_after
+
+
+class PrazoExcedidoError(TimeoutError):
+    """O ajuste não terminou dentro do prazo e o processo foi encerrado"""
+
+
+def _executar_no_filho(conexao, fn, args, kwargs):
+    # Alvo do processo descartável: devolve (ok, resultado ou exceção) pelo pipe
+    try:
+        conexao.send((True, fn(*args, **kwargs)))
+    except BaseException as e:
+        conexao.send((False, e))
+    finally:
+        conexao.close()
+
+
+def _aguardar_filho(conexao, prazo: float):
+    if not conexao.poll(max(0.0, prazo)):
+        raise PrazoExcedidoError(f"Ajuste não terminou em {prazo:.1f}s")
+    try:
+        return conexao.recv()
+    except EOFError:
+        # O filho morreu sem responder (ex.: OOM)
+        raise RuntimeError("Processo de ajuste terminou sem devolver resultado")
+
+
+def _iniciar_e_aguardar(processo, emissor, receptor, limite: float, cancelado):
+    """Roda numa thread: start() (que conversa com o forkserver, e o sobe na primeira vez) e a espera.
+
+    O prazo restante é contado depois do start(); o processo é morto ao sair, terminado ou não.
+    """
+    iniciado = False
+    try:
+        try:
+            processo.start()
+            iniciado = True
+        finally:
+            emissor.close()
+        if cancelado.is_set():
+            # Quem pediu desistiu enquanto o processo subia
+            processo.kill()
+        return _aguardar_filho(receptor, limite - time.monotonic())
+    finally:
+        if iniciado:
+            if processo.is_alive():
+                processo.kill()
+            processo.join(timeout=1)
+        receptor.close()
+
+
+class ExecutorAjuste:
+    """Processos de ajuste de modelo com prazo, limite de concorrência e profundidade de fila limitada"""
+
+    def __init__(self, tipo: str = FIT_EXECUTOR, workers: int = FIT_WORKERS,
+                 max_fila: int = FIT_MAX_FILA, retry_after: int = FIT_RETRY_AFTER):
+        self.tipo = tipo
+        self.workers = max(1, workers)
+        self.max_fila = max(0, max_fila)
+        self.retry_after = retry_after
+        self._contexto = None
+        self._processos = set()  # em execução, para encerrar() matar junto com a aplicação
+        self.cortados = 0
+        # Só são alterados no event loop, então não precisam de lock
+        self._pendentes = 0
+        self._rodando = 0
+        self._vagas = None  # (loop, semáforo com `workers` vagas)
+        self.rejeitados = 0
+
+    def _obter_contexto(self):
+        if self._contexto is None:
+            self._contexto = multiprocessing.get_context(FIT_MP_CONTEXTO)
+            if FIT_MP_CONTEXTO == "forkserver":
+                self._contexto.set_forkserver_preload(FIT_PRELOAD)
+        return self._contexto
+
+    def _obter_vagas(self):
+        # Semáforo do event loop atual (cada asyncio.run tem o seu)
+        loop = asyncio.get_running_loop()
+        if self._vagas is None or self._vagas[0] is not loop:
+            self._vagas = (loop, asyncio.Semaphore(self.workers))
+        return self._vagas[1]
+
+    async def executar_com_prazo(self, fn, *args, prazo: float, **kwargs):
+        """Executa `fn` num processo próprio que é morto se passar de `prazo` segundos.
+
+        Um ajuste travado não segura uma vaga: o processo é encerrado e levanta
+        PrazoExcedidoError. No máximo `workers` processos rodam
+        ao mesmo tempo; até `max_fila` esperam a vez (o tempo na fila conta no prazo)
+        e além disso a chamada falha com FilaCheiaError.
+        """
+        if self._pendentes >= self.workers + self.max_fila:
+            self.rejeitados += 1
+            raise FilaCheiaError(self.retry_after)
+
+        limite = time.monotonic() + prazo
+        self._pendentes += 1
+        try:
+            vagas = self._obter_vagas()
+            try:
+                async with asyncio.timeout(max(0.0, limite - time.monotonic())):
+                    await vagas.acquire()
+            except TimeoutError:
+                self.cortados += 1
+                raise PrazoExcedidoError(f"Ajuste não saiu da fila em {prazo:.1f}s")
+            try:
+                self._rodando += 1
+                ok, valor = await self._rodar(fn, args, kwargs, limite)
+            finally:
+                self._rodando -= 1
+                vagas.release()
+        finally:
+            self._pendentes -= 1
+
+        if not ok:
+            raise valor
+        return valor
+
+    async def _rodar(self, fn, args, kwargs, limite: float):
+        if self.tipo == "thread":
+            return await self._rodar_em_thread(fn, args, kwargs, limite)
+
+        contexto = self._obter_contexto()
+        receptor, emissor = contexto.Pipe(duplex=False)
+        processo = contexto.Process(target=_executar_no_filho, args=(emissor, fn, args, kwargs), daemon=True)
+        cancelado = threading.Event()
+        self._processos.add(processo)
+        try:
+            # O start() bloqueia (na primeira vez o forkserver sobe e importa o preload): fora do event loop
+            return await asyncio.to_thread(_iniciar_e_aguardar, processo, emissor, receptor, limite, cancelado)
+        except PrazoExcedidoError:
+            self.cortados += 1
+            raise
+        except asyncio.CancelledError:
+            # A thread continua esperando; matar o processo a libera na hora
+            cancelado.set()
+            if processo.pid is not None:
+                processo.kill()
+            raise
+        finally:
+            self._processos.discard(processo)
+
+    async def _rodar_em_thread(self, fn, args, kwargs, limite: float):
+        tarefa = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+        feitas, _ = await asyncio.wait({tarefa}, timeout=max(0.0, limite - time.monotonic()))
+        if not feitas:
+            # A thread não pode ser morta: segue até o fim e o resultado é descartado
+            self.cortados += 1
+            raise PrazoExcedidoError("Ajuste não terminou no prazo")
+        erro = tarefa.exception()
+        return (False, erro) if erro is not None else (True, tarefa.result())
+
+    def aquecer(self):
+        """Sobe o forkserver (com o preload) antes do primeiro ajuste; bloqueia, então rode numa thread"""
+        if self._obter_contexto().get_start_method() == "forkserver":
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+
+    def estado(self) -> dict:
+        """Informações da fila de ajustes"""
+        return {
+            'tipo': self.tipo,
+            'workers': self.workers,
+            'max_fila': self.max_fila,
+            'pendentes': self._pendentes,
+            'rodando': self._rodando,
+            'rejeitados': self.rejeitados,
+            'cortados_por_prazo': self.cortados
+        }
+
+    def encerrar(self):
+        """Mata os processos de ajuste ainda em execução"""
+        for processo in list(self._processos):
+            if processo.pid is not None:
+                processo.kill()
+
+
+# Instância global do executor
+executor_ajuste = ExecutorAjuste()
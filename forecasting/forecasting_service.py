@@ -1,53 +1,143 @@
 # forecasting_service.py
+import asyncio
+import os
+import time
+import numpy as np
 import pandas as pd
 from sqlalchemy import text
-from database import get_session, engine
-from forecasting.model_selector import selecionar_melhor_modelo
+from database import DB_ASYNC, get_engine, execute_with_retry, execute_with_retry_async
+from forecasting.model_selector import (
+    selecionar_melhor_modelo, preparar_selecao, avaliar_candidato, escolher_vencedor
+)
+from forecasting.baseline_model import ModeloBaseline
+from forecasting.executor import executor_ajuste, FilaCheiaError, PrazoExcedidoError
+from forecasting.model_cache import cache_modelos, impressao_serie
+from forecasting.coalescer import Coalescedor
+from forecasting.order_search import ORDEM_AUTO, ORDEM_ORCAMENTO, obter_ordens
+from forecasting.incremental import estados_modelo, mesclar_delta, novo_estado, estender_modelo
+from forecasting.model_store import MODEL_STORE_ATIVO, armazem_modelos, enxugar_modelo
+from forecasting.snapshot_store import SNAPSHOT_ATIVO, snapshot_transacoes
+from forecasting.metrics import cronometrado, executar_cronometrado, registrar_etapa
 import logging
 
 logger = logging.getLogger(__name__)
 
-def carregar_dados_transacao(tipo: str = None, id_usuario: int = None):
-    try:
-        query = 'SELECT t.data, t.valor FROM transacoes t JOIN produtos p ON t."produtoId" = p.id'
-        clauses = []
-        params = {}
+# Prazo total de uma seleção completa dentro da requisição; o que não terminar é cortado
+PREVISAO_PRAZO = float(os.getenv("PREVISAO_PRAZO", "25"))
+# Limite de iterações do otimizador nos ajustes com prazo
+PREVISAO_MAXITER = int(os.getenv("PREVISAO_MAXITER", "50"))
 
-        if tipo in ["receita", "despesa"]:
-            clauses.append("t.tipo = :tipo")
-            params["tipo"] = tipo
+# Ajustes e previsões completas idênticos em voo são compartilhados (single-flight)
+coalescedor_ajustes = Coalescedor()
+coalescedor_previsoes = Coalescedor()
 
-        if id_usuario:
-            query += ' JOIN itens_venda iv ON t."produtoId" = iv.id_produto'
-            query += " JOIN vendas v ON iv.id_venda = v.id"
-            clauses.append("v.id_usuario = :id_usuario")
-            params["id_usuario"] = id_usuario
+# Semi-join: a transação entra uma única vez se o produto aparece em alguma venda do usuário.
+# Com JOIN direto em itens_venda/vendas cada transação era repetida por linha de venda do produto.
+FILTRO_USUARIO_SQL = """EXISTS (
+    SELECT 1 FROM itens_venda iv
+    JOIN vendas v ON iv.id_venda = v.id
+    WHERE iv.id_produto = t."produtoId" AND v.id_usuario = :id_usuario
+)"""
 
-        if clauses:
-            query += " WHERE " + " AND ".join(clauses)
+def expr_dia_sql(dialeto: str, coluna: str = "t.data") -> str:
+    """Dia da coluna calculado no próprio banco, como DATE (texto 'AAAA-MM-DD' no SQLite).
 
-        query += " ORDER BY t.data"
+    O driver devolve datas que tanto o pandas quanto o NumPy (datetime64[D]) convertem direto.
+    """
+    if dialeto == "sqlite":
+        return f"date({coluna})"
+    return f"CAST({coluna} AS DATE)"
 
-        with get_session() as session:
-            df = pd.read_sql(sql=text(query), con=session.connection(), params=params)
+def _filtros_transacao(tipo: str = None, id_usuario: int = None, desde=None, ate=None):
+    """(WHERE, parâmetros) da série de transações, comuns às cargas síncrona e assíncrona"""
+    clauses = []
+    params = {}
 
-            if df.empty:
-                logger.warning(f"Nenhum dado encontrado para o usuário {id_usuario} e tipo '{tipo}'")
-                return pd.DataFrame(columns=['data', 'valor'])
+    if tipo in ["receita", "despesa"]:
+        clauses.append("t.tipo = :tipo")
+        params["tipo"] = tipo
 
-            df['data'] = pd.to_datetime(df['data'])
+    if id_usuario:
+        clauses.append(FILTRO_USUARIO_SQL)
+        params["id_usuario"] = id_usuario
+
+    if desde is not None:
+        clauses.append("t.data >= :desde")
+        params["desde"] = pd.Timestamp(desde).to_pydatetime()
+
+    if ate is not None:
+        clauses.append("t.data < :ate")
+        params["ate"] = (pd.Timestamp(ate).normalize() + pd.Timedelta(days=1)).to_pydatetime()
+
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+def _sql_diario(dialeto: str, where: str) -> str:
+    """SUM(valor) por dia, agregado no servidor (uma linha por dia)"""
+    dia = expr_dia_sql(dialeto)
+    return (
+        f"SELECT {dia} AS data, CAST(SUM(t.valor) AS DOUBLE PRECISION) AS valor"
+        f' FROM transacoes t JOIN produtos p ON t."produtoId" = p.id{where}'
+        f" GROUP BY {dia} ORDER BY {dia}"
+    )
 
+def _densificar_diario(df):
+    """Reindexa para frequência diária preenchendo dias sem transação com 0 (sem loop em Python)."""
+    indice = pd.DatetimeIndex(pd.to_datetime(df.index), name=None)
+    if indice.tz is not None:
+        # Carga bruta de timestamptz (agregar_no_banco=False) vem com fuso; a série diária trabalha sem fuso
+        indice = indice.tz_localize(None)
+    df.index = indice
+    dias = pd.date_range(df.index.min(), df.index.max(), freq="D")
+    return df.reindex(dias, fill_value=0.0)
+
+@cronometrado("carga_banco")
+def carregar_dados_transacao(tipo: str = None, id_usuario: int = None, desde=None, ate=None,
+                             agregar_no_banco: bool = True):
+    """Carrega a série diária de `valor` (DataFrame indexado por dia, frequência 'D').
+
+    Com `agregar_no_banco=True` (padrão) o SUM por dia roda no servidor e só
+    trafega uma linha por dia; `False` mantém o modo antigo, que baixa as
+    transações brutas e agrega no pandas. `desde`/`ate` limitam a janela
+    de histórico buscada.
+    """
+    try:
+        where, params = _filtros_transacao(tipo, id_usuario, desde, ate)
+
+        def consultar(session):
+            conn = session.connection()
+
+            if agregar_no_banco:
+                query = _sql_diario(conn.dialect.name, where)
+            else:
+                query = (f'SELECT t.data, t.valor FROM transacoes t JOIN produtos p ON t."produtoId" = p.id{where}'
+                         " ORDER BY t.data")
+
+            return pd.read_sql(sql=text(query), con=conn, params=params,
+                               dtype={"valor": "float64"} if agregar_no_banco else None)
+
+        # Leitura idempotente: repetida inteira se a conexão cair no meio
+        df = execute_with_retry(consultar)
+
+        if df.empty:
+            logger.warning(f"Nenhum dado encontrado para o usuário {id_usuario} e tipo '{tipo}'")
+            return pd.DataFrame(columns=['data', 'valor'])
+
+        if agregar_no_banco:
+            df = df.set_index('data')
+        else:
             # ✅ Correção: garantir que os valores sejam numéricos
             df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
             df = df.dropna(subset=['valor'])
+            if df.empty:
+                return pd.DataFrame(columns=['data', 'valor'])
+            df['data'] = pd.to_datetime(df['data'])
+            df = df.set_index('data')[['valor']].astype('float64').resample('D').sum()
 
-            df = df.set_index('data')
-            df = df.groupby(df.index.date).sum()
-            df.index = pd.to_datetime(df.index)
-            df = df.asfreq('D').fillna(0)
+        df = _densificar_diario(df)
 
-            logger.info(f"Carregados {len(df)} registros para usuário {id_usuario}")
-            return df
+        logger.info(f"Carregados {len(df)} registros para usuário {id_usuario}")
+        return df
 
     except Exception as e:
         logger.error(f"Erro ao carregar dados: {e}")
@@ -55,6 +145,46 @@ def carregar_dados_transacao(tipo: str = None, id_usuario: int = None):
 
 
 
+def arrays_diarios(datas, valores):
+    """Densifica (datas, valores) de dias distintos em frequência diária, com 0 nos dias sem transação"""
+    datas = np.asarray(datas, dtype="datetime64[D]")
+    valores = np.asarray(valores, dtype="float64")
+    if len(datas) == 0:
+        return datas, valores
+    posicoes = (datas - datas.min()).astype("int64")
+    densos = np.zeros(int(posicoes.max()) + 1, dtype="float64")
+    np.add.at(densos, posicoes, valores)
+    return np.arange(datas.min(), datas.min() + len(densos)), densos
+
+def serie_de_arrays(datas, valores):
+    """pd.Series diária a partir dos arrays (sem copiar os valores)"""
+    indice = pd.DatetimeIndex(datas.astype("datetime64[ns]"), freq="D" if len(datas) else None)
+    return pd.Series(valores, index=indice, name="valor", copy=False)
+
+@cronometrado("carga_banco")
+async def carregar_dados_transacao_async(tipo: str = None, id_usuario: int = None, desde=None, ate=None):
+    """Mesma consulta agregada do carregar_dados_transacao pelo engine assíncrono (DB_ASYNC).
+
+    As linhas viram direto arrays NumPy (datas datetime64[D], valores float64)
+    já densificados por dia, sem passar por DataFrame.
+    """
+    where, params = _filtros_transacao(tipo, id_usuario, desde, ate)
+
+    async def consultar(conn):
+        return (await conn.execute(text(_sql_diario(conn.dialect.name, where)), params)).all()
+
+    try:
+        linhas = await execute_with_retry_async(consultar)
+    except Exception as e:
+        logger.error(f"Erro ao carregar dados: {e}")
+        linhas = []
+
+    if not linhas:
+        logger.warning(f"Nenhum dado encontrado para o usuário {id_usuario} e tipo '{tipo}'")
+    datas = np.array([linha[0] for linha in linhas], dtype="datetime64[D]")
+    valores = np.fromiter((linha[1] or 0.0 for linha in linhas), dtype="float64", count=len(linhas))
+    return arrays_diarios(datas, valores)
+
 def carregar_dados_transacao_alternativo(tipo: str = None):
     """Versão alternativa usando engine diretamente"""
     try:
@@ -70,7 +200,7 @@ def carregar_dados_transacao_alternativo(tipo: str = None):
         # ✅ Usa engine diretamente - mais direto para pandas
         df = pd.read_sql(
             sql=query,
-            con=engine,  # Engine funciona diretamente com pandas
+            con=get_engine(),  # Engine funciona diretamente com pandas
             params=params
         )
         
@@ -92,12 +222,32 @@ def carregar_dados_transacao_alternativo(tipo: str = None):
         logger.error(f"Erro ao carregar dados de transação: {e}")
         return pd.DataFrame(columns=['data', 'valor'])
 
-def prever(modelo, periodo: int = 30):
+def intervalos_previsao(modelo, periodo: int, niveis):
+    """Previsão pontual e {nivel: (inferior, superior)} do modelo já ajustado, sem novos fits.
+
+    Nos resultados do statsmodels sai de um único get_forecast (conf_int por nível);
+    nas baselines, dos quantis dos resíduos.
+    """
+    if hasattr(modelo, 'get_forecast'):
+        resultado = modelo.get_forecast(steps=periodo)
+        limites = {}
+        for nivel in niveis:
+            conf = np.asarray(resultado.conf_int(alpha=1 - nivel))
+            limites[nivel] = (conf[:, 0], conf[:, 1])
+        return np.asarray(resultado.predicted_mean), limites
+    return modelo.forecast(steps=periodo), modelo.intervalos(periodo, niveis)
+
+@cronometrado("previsao")
+def prever(modelo, periodo: int = 30, niveis=None):
+    """DataFrame com data e previsao; com `niveis` (ex.: (0.8, 0.95)) inclui inferior_80/superior_80 etc."""
     try:
         if not hasattr(modelo, 'forecast'):
             raise ValueError("Modelo fornecido não possui método forecast()")
 
-        previsao = modelo.forecast(steps=periodo)
+        if niveis:
+            previsao, limites = intervalos_previsao(modelo, periodo, niveis)
+        else:
+            previsao, limites = modelo.forecast(steps=periodo), {}
 
         if hasattr(modelo, 'data') and hasattr(modelo.data, 'dates'):
             ult_data = modelo.data.dates[-1]
@@ -106,28 +256,252 @@ def prever(modelo, periodo: int = 30):
 
         datas = pd.date_range(start=ult_data + pd.Timedelta(days=1), periods=periodo)
 
-        return pd.DataFrame({'data': datas, 'previsao': previsao})
+        df = pd.DataFrame({'data': datas, 'previsao': np.asarray(previsao)})
+        for nivel, (inferior, superior) in limites.items():
+            rotulo = round(nivel * 100)
+            df[f'inferior_{rotulo}'] = inferior
+            df[f'superior_{rotulo}'] = superior
+        return df
 
     except Exception as e:
         logger.error(f"Erro ao gerar previsão: {e}")
         return pd.DataFrame(columns=['data', 'previsao'])
 
+def ajustar_e_prever(serie, periodo: int = 30, ordens: dict = None):
+    """Seleção de modelo + previsão numa chamada só, para rodar dentro do executor de ajustes"""
+    modelo, nome_modelo, scores = selecionar_melhor_modelo(serie, ordens=ordens)
+    previsao = prever(modelo, periodo)
+    return modelo, nome_modelo, scores, previsao
+
+def _obter_estado(chave_estado, serie=None):
+    """Estado incremental em memória; depois de um restart vem do armazém em disco (se bater com `serie`)"""
+    estado = estados_modelo.obter(chave_estado)
+    if estado is None and MODEL_STORE_ATIVO:
+        estado = armazem_modelos.carregar(chave_estado, serie)
+        if estado is not None:
+            estados_modelo.guardar(chave_estado, estado)
+    return estado
+
+async def _carregar_valores(tipo: str = None, id_usuario: int = None, desde=None):
+    # Engine assíncrono com DB_ASYNC; senão a carga síncrona roda numa thread
+    if DB_ASYNC:
+        datas, valores = await carregar_dados_transacao_async(tipo=tipo, id_usuario=id_usuario, desde=desde)
+        return serie_de_arrays(datas, valores) if len(datas) else None
+    df = await asyncio.to_thread(carregar_dados_transacao, tipo=tipo, id_usuario=id_usuario, desde=desde)
+    return df["valor"] if not df.empty else None
+
+def _serie_base(chave):
+    """Série já conhecida para a chave: o snapshot local (memory-map) ou, sem snapshots, a do estado incremental.
+
+    Com snapshots ligados só eles servem de base: sem snapshot válido (inexistente ou
+    vencido) a carga é completa, para pegar lançamentos retroativos, correções e exclusões.
+    O estado incremental não serve para isso porque ele mesmo veio de cargas por delta.
+    """
+    if SNAPSHOT_ATIVO:
+        return snapshot_transacoes.carregar(chave)
+    estado = _obter_estado(chave)
+    return estado["serie"] if estado is not None else None
+
+def _guardar_snapshot(chave, serie, base):
+    if SNAPSHOT_ATIVO and serie is not base:
+        try:
+            snapshot_transacoes.guardar(chave, serie, carga_completa=base is None)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o snapshot em disco: {e}")
+
+async def carregar_serie(tipo: str = None, id_usuario: int = None):
+    """Série diária de `valor`; havendo snapshot (ou, sem snapshots, estado incremental) só busca no banco o delta.
+
+    O delta vai do último dia conhecido (a marca d'água) em diante, e a série
+    resultante volta para o snapshot em disco.
+    """
+    chave = (tipo, id_usuario)
+    base = await asyncio.to_thread(_serie_base, chave)
+    if base is None:
+        serie = await _carregar_valores(tipo, id_usuario)
+        serie = serie if serie is not None else pd.Series(dtype="float64")
+    else:
+        # O último dia guardado pode ter sido parcial: o delta começa nele
+        serie = mesclar_delta(base, await _carregar_valores(tipo, id_usuario, desde=base.index[-1]))
+    await asyncio.to_thread(_guardar_snapshot, chave, serie, base)
+    return serie
+
+def carregar_serie_sincrona(tipo: str = None, id_usuario: int = None):
+    """carregar_serie para quem está fora do event loop (mesmo snapshot e delta, carga síncrona)"""
+    chave = (tipo, id_usuario)
+    base = _serie_base(chave)
+    desde = base.index[-1] if base is not None else None
+    df = carregar_dados_transacao(tipo=tipo, id_usuario=id_usuario, desde=desde)
+    valores = df["valor"] if not df.empty else None
+    if base is None:
+        serie = valores if valores is not None else pd.Series(dtype="float64")
+    else:
+        serie = mesclar_delta(base, valores)
+    _guardar_snapshot(chave, serie, base)
+    return serie
+
+async def obter_previsao(serie, tipo: str = None, id_usuario: int = None, periodo: int = 30, niveis=None):
+    """Previsão para a série diária, evitando reajustar sempre que possível.
+
+    Ordem: modelo em cache para a mesma série -> extensão incremental do último
+    modelo com os dias novos -> seleção completa com prazo (pode levantar
+    FilaCheiaError). Retorna (nome_modelo, scores, previsao, prazo_excedido), onde
+    prazo_excedido indica que o modelo servido é um fallback de um ajuste cortado.
+    `niveis` inclui os intervalos de previsão (ver prever).
+    """
+    chave = (tipo, id_usuario, impressao_serie(serie))
+    em_cache = cache_modelos.obter(chave)
+    if em_cache is not None:
+        modelo, nome_modelo, scores, prazo_excedido = em_cache
+        return nome_modelo, scores, prever(modelo, periodo, niveis), prazo_excedido
+
+    chave_estado = (tipo, id_usuario)
+    estado = await asyncio.to_thread(_obter_estado, chave_estado, serie)
+    if estado is not None:
+        atualizado = await asyncio.to_thread(estender_modelo, estado, serie)
+        if atualizado is not None:
+            modelo, nome_modelo, scores = atualizado["modelo"], atualizado["nome"], atualizado["scores"]
+            await asyncio.to_thread(_guardar_em_memoria, chave, (modelo, nome_modelo, scores, False),
+                                    chave_estado, atualizado)
+            return nome_modelo, scores, prever(modelo, periodo, niveis), False
+
+    modelo, nome_modelo, scores, prazo_excedido = await coalescedor_ajustes.executar(
+        chave, _ajustar_e_guardar, serie, chave
+    )
+    return nome_modelo, scores, prever(modelo, periodo, niveis), prazo_excedido
+
+@cronometrado("selecao")
+async def selecionar_com_prazo(serie, prazo: float = PREVISAO_PRAZO, ordens: dict = None):
+    """Seleção de modelo com prazo total de `prazo` segundos.
+
+    As baselines são avaliadas na hora; ARIMA e SARIMA rodam em paralelo em
+    processos descartáveis (maxiter limitado) e o que passar do prazo é morto.
+    Serve o melhor modelo que terminou, ou a melhor baseline. Retorna
+    (modelo, nome, scores, prazo_excedido).
+    """
+    limite = time.monotonic() + prazo
+    ordens = ordens or {}
+    serie, horizon, restante, scores, melhor_baseline, basta = preparar_selecao(serie)
+
+    if basta:
+        return ModeloBaseline(melhor_baseline, serie), melhor_baseline, scores, False
+
+    nomes = ("ARIMA", "SARIMA")
+    resultados = await asyncio.gather(*(
+        executor_ajuste.executar_com_prazo(
+            executar_cronometrado, avaliar_candidato, nome, serie, horizon, ordens.get(nome), PREVISAO_MAXITER,
+            prazo=limite - time.monotonic()
+        )
+        for nome in nomes
+    ), return_exceptions=True)
+
+    fits = {}
+    prazo_excedido = False
+    for nome, resultado in zip(nomes, resultados):
+        if isinstance(resultado, PrazoExcedidoError):
+            logger.warning(f"{nome} cortado pelo prazo de {prazo:.1f}s")
+            prazo_excedido = True
+        elif isinstance(resultado, FilaCheiaError) and all(isinstance(r, FilaCheiaError) for r in resultados):
+            raise resultado
+        elif isinstance(resultado, BaseException):
+            logger.warning(f"Falha ao ajustar {nome}: {resultado}")
+        else:
+            # Tempo do ajuste medido dentro do processo filho
+            (fits[nome], scores[nome]), segundos = resultado
+            registrar_etapa(f"ajuste_{nome.lower()}", segundos)
+
+    modelo, nome = await asyncio.to_thread(escolher_vencedor, serie, restante, scores, fits, melhor_baseline)
+    return modelo, nome, scores, prazo_excedido
+
+async def _ajustar_e_guardar(serie, chave):
+    """Seleção completa com prazo; só roda uma vez por série mesmo com chamadas concorrentes"""
+    tipo, id_usuario, _ = chave
+    inicio = time.monotonic()
+    ordens = None
+    if ORDEM_AUTO:
+        # Só a primeira seleção de cada série paga a busca (com no máximo metade do prazo)
+        ordens = await obter_ordens((tipo, id_usuario), serie, executor_ajuste,
+                                    min(ORDEM_ORCAMENTO, PREVISAO_PRAZO / 2))
+    prazo = PREVISAO_PRAZO - (time.monotonic() - inicio)
+    modelo, nome_modelo, scores, prazo_excedido = await selecionar_com_prazo(serie, prazo, ordens)
+    modelo = await asyncio.to_thread(_enxugar, modelo)
+    resultado = (modelo, nome_modelo, scores, prazo_excedido)
+    if prazo_excedido:
+        # Fallback de um ajuste cortado não vira base para as extensões incrementais
+        await asyncio.to_thread(_guardar_em_memoria, chave, resultado)
+        return resultado
+
+    estado = novo_estado(serie, modelo, nome_modelo, scores)
+    await asyncio.to_thread(_guardar_em_memoria, chave, resultado, (tipo, id_usuario), estado)
+    if MODEL_STORE_ATIVO:
+        try:
+            await asyncio.to_thread(armazem_modelos.guardar, (tipo, id_usuario), estado)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o modelo em disco: {e}")
+    return resultado
+
+def _enxugar(modelo):
+    # O resultado do ajuste traz as saídas do filtro e da suavização a cada passo (dezenas de MB num SARIMA);
+    # em memória fica só o necessário para prever e estender
+    try:
+        return enxugar_modelo(modelo)
+    except Exception as e:
+        logger.warning(f"Não foi possível enxugar o modelo, guardando o resultado completo: {e}")
+        return modelo
+
+def _guardar_em_memoria(chave, resultado, chave_estado=None, estado=None):
+    """Modelo no cache (e estado incremental); roda numa thread por causa da estimativa de tamanho"""
+    if estado is not None:
+        estados_modelo.guardar(chave_estado, estado)
+    cache_modelos.guardar(chave, resultado)
+
+def _resultado_vazio():
+    logger.warning("Nenhum dado histórico disponível para previsão.")
+    return {
+        "historico": pd.DataFrame(),
+        "previsao": pd.DataFrame(),
+        "modelo": "nenhum"
+    }
+
 def executar_previsao_completa(id_usuario: int, tipo: str = "receita", periodo: int = 7):
-    df = carregar_dados_transacao(tipo=tipo, id_usuario=id_usuario)
+    serie = carregar_serie_sincrona(tipo=tipo, id_usuario=id_usuario)
 
-    if df.empty:
-        logger.warning("Nenhum dado histórico disponível para previsão.")
-        return {
-            "historico": pd.DataFrame(),
-            "previsao": pd.DataFrame(),
-            "modelo": "nenhum"
-        }
+    if serie.empty:
+        return _resultado_vazio()
 
-    modelo, nome_modelo = selecionar_melhor_modelo(df)
-    previsao = prever(modelo, periodo)
+    _, nome_modelo, scores, previsao = ajustar_e_prever(serie, periodo)
+
+    return {
+        "historico": serie.to_frame("valor"),
+        "previsao": previsao,
+        "modelo": nome_modelo,
+        "scores": scores
+    }
+
+def executar_previsao_completa_async(id_usuario: int, tipo: str = "receita", periodo: int = 7):
+    """Mesmo fluxo de executar_previsao_completa, com o ajuste no executor de processos.
+
+    A carga do banco roda numa thread (incremental quando há estado) e o ajuste
+    no executor de processos, ou vem do cache/extensão incremental; levanta FilaCheiaError quando
+    não há vaga para o ajuste. Chamadas concorrentes com os mesmos argumentos
+    aguardam a mesma execução.
+    """
+    return coalescedor_previsoes.executar(
+        (id_usuario, tipo, periodo), _executar_previsao_completa_async, id_usuario, tipo, periodo
+    )
+
+async def _executar_previsao_completa_async(id_usuario: int, tipo: str, periodo: int):
+    serie = await carregar_serie(tipo=tipo, id_usuario=id_usuario)
+
+    if serie.empty:
+        return _resultado_vazio()
+
+    nome_modelo, scores, previsao, prazo_excedido = await obter_previsao(serie, tipo, id_usuario, periodo)
 
     return {
-        "historico": df,
+        "historico": serie.to_frame("valor"),
         "previsao": previsao,
-        "modelo": nome_modelo
-    }
\ No newline at end of file
+        "modelo": nome_modelo,
+        "scores": scores,
+        "prazo_excedido": prazo_excedido
+    }
@@ -0,0 +1,114 @@
+# Atualização incremental: guarda por (tipo, id_usuario) a última série carregada e o modelo ajustado nela.
+# Nas próximas chamadas só os dias a partir da marca d'água vêm do banco e o modelo é estendido
+# com os mesmos parâmetros (refiltrado, sem novo MLE). A reseleção completa só acontece
+# por agenda ou quando o erro nos dias novos deriva além do limiar.
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting.baseline_model import ModeloBaseline
+from forecasting.model_cache import CacheModelos, estimar_tamanho
+from forecasting.model_store import enxugar_modelo
+
+logger = logging.getLogger(__name__)
+
+# Intervalo máximo entre reseleções completas (segundos)
+INCREMENTAL_INTERVALO_RESELECAO = int(os.getenv("INCREMENTAL_INTERVALO_RESELECAO", str(24 * 3600)))
+# Reseleciona se o RMSE nos dias novos passar de LIMIAR x o RMSE do holdout do modelo escolhido
+INCREMENTAL_LIMIAR_DERIVA = float(os.getenv("INCREMENTAL_LIMIAR_DERIVA", "2.0"))
+INCREMENTAL_MAX_ESTADOS = int(os.getenv("INCREMENTAL_MAX_ESTADOS", "1024"))
+INCREMENTAL_MAX_MB = int(os.getenv("INCREMENTAL_MAX_MB", "64"))
+
+
+def tamanho_estado(estado) -> int:
+    """Bytes do estado: a série e os arrays do modelo enxuto (que aponta para a mesma série)"""
+    vistos = set()
+    return estimar_tamanho(estado["serie"], vistos) + estimar_tamanho(estado["modelo"], vistos)
+
+
+# (tipo, id_usuario) -> {"serie", "modelo", "nome", "scores", "ajustado_em"}
+estados_modelo = CacheModelos(max_itens=INCREMENTAL_MAX_ESTADOS, ttl=INCREMENTAL_INTERVALO_RESELECAO * 7,
+                              max_bytes=INCREMENTAL_MAX_MB * 1024 * 1024, medir=tamanho_estado)
+
+
+def marca_dagua(estado):
+    """Último dia coberto pelo estado (o delta é carregado a partir dele, inclusive)"""
+    return estado["serie"].index[-1]
+
+
+def mesclar_delta(serie, delta):
+    """Junta a série guardada com os dias carregados desde a marca d'água.
+
+    O último dia guardado pode ter sido parcial, então ele é substituído pelo valor do delta.
+    """
+    if delta is None or len(delta) == 0:
+        return serie
+
+    inicio_delta = delta.index[0]
+    # Delta só repetindo o fim já guardado (caso comum entre dois requests): devolve a mesma série, sem cópia
+    if (inicio_delta >= serie.index[0] and delta.index[-1] == serie.index[-1]
+            and np.array_equal(serie.loc[inicio_delta:].to_numpy(), delta.to_numpy())):
+        return serie
+
+    combinada = pd.concat([serie[serie.index < inicio_delta], delta])
+    dias = pd.date_range(combinada.index[0], combinada.index[-1], freq="D")
+    return combinada.reindex(dias, fill_value=0.0)
+
+
+def novo_estado(serie, modelo, nome, scores):
+    return {
+        "serie": serie,
+        "modelo": modelo,
+        "nome": nome,
+        "scores": scores,
+        "ajustado_em": time.monotonic()
+    }
+
+
+def estender_modelo(estado, serie):
+    """Estende o modelo do estado até o fim de `serie` reaproveitando os parâmetros.
+
+    Retorna o novo estado, ou None quando é preciso reselecionar do zero
+    (agenda vencida, deriva do erro ou séries incompatíveis).
+    """
+    antiga = estado["serie"]
+    modelo = estado["modelo"]
+
+    if time.monotonic() - estado["ajustado_em"] > INCREMENTAL_INTERVALO_RESELECAO:
+        logger.info("Reseleção agendada: intervalo desde o último ajuste completo vencido")
+        return None
+
+    if serie.index[0] != antiga.index[0] or serie.index[-1] < antiga.index[-1]:
+        return None
+
+    novos = serie[serie.index > antiga.index[-1]]
+    sobreposicao = serie[serie.index <= antiga.index[-1]]
+
+    try:
+        if len(novos):
+            preds = np.asarray(modelo.forecast(steps=len(novos)))
+            rmse_novos = float(np.sqrt(np.mean((novos.to_numpy() - preds) ** 2)))
+            rmse_base = estado["scores"].get(estado["nome"], np.inf)
+            if np.isfinite(rmse_base) and rmse_novos > INCREMENTAL_LIMIAR_DERIVA * max(rmse_base, 1e-9):
+                logger.info(f"Deriva detectada (RMSE {rmse_novos:.2f} vs {rmse_base:.2f}), reselecionando")
+                return None
+
+        iguais = np.array_equal(sobreposicao.to_numpy(), antiga.to_numpy())
+        if iguais and not len(novos):
+            estendido = modelo
+        elif isinstance(modelo, ModeloBaseline):
+            # Algum dia já visto mudou (ex.: último dia era parcial): reaplica na série toda
+            estendido = modelo.append(novos) if iguais else modelo.apply(serie)
+        else:
+            # append/apply do statsmodels refiltram a série inteira com os mesmos parâmetros, guardando
+            # todas as saídas do filtro; refiltrar pela especificação dá a mesma previsão e mantém o modelo enxuto
+            estendido = enxugar_modelo(modelo, serie)
+    except Exception as e:
+        logger.warning(f"Falha na atualização incremental, reselecionando: {e}")
+        return None
+
+    atualizado = dict(estado, serie=serie, modelo=estendido)
+    return atualizado
@@ -0,0 +1,266 @@
+# Métricas de latência por etapa (carga do banco, ajustes, previsão, consultas do prompt, Gemini).
+# Cada etapa medida alimenta um histograma exposto em /metrics (formato texto do Prometheus) e,
+# dentro de uma requisição, a lista de etapas que vira o cabeçalho Server-Timing.
+# Também traz o perfilador opcional por requisição (pyinstrument se instalado, senão cProfile).
+import functools
+import inspect
+import io
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos baldes dos histogramas: de consultas rápidas a seleções completas
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+
+# Perfilador: só atende ?perfil=1 / X-Perfil: 1 com PERFIL_ATIVO=True; PERFIL_AMOSTRAGEM
+# perfila essa fração das requisições mesmo sem pedido
+PERFIL_ATIVO = os.getenv("PERFIL_ATIVO", "False") == "True"
+PERFIL_AMOSTRAGEM = float(os.getenv("PERFIL_AMOSTRAGEM", "0"))
+PERFIL_DIR = os.getenv("PERFIL_DIR", ".perfis")
+
+
+def _rotulos(rotulos: dict) -> str:
+    if not rotulos:
+        return ""
+    pares = ",".join(f'{k}="{str(v)}"' for k, v in sorted(rotulos.items()))
+    return "{" + pares + "}"
+
+
+class Histograma:
+    """Contagens acumuladas por balde, soma e total de observações"""
+
+    def __init__(self, baldes=BALDES):
+        self.baldes = baldes
+        self.contagens = [0] * len(baldes)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(self.baldes):
+            if valor <= limite:
+                self.contagens[i] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class RegistroMetricas:
+    """Histogramas e contadores por (nome, rótulos), exportados no formato texto do Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}  # nome -> {rótulos (tupla ordenada): Histograma}
+        self._contadores = {}   # nome -> {rótulos: valor}
+        self._ajuda = {}
+
+    def observar(self, nome: str, valor: float, ajuda: str = "", **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._ajuda.setdefault(nome, ajuda)
+            serie = self._histogramas.setdefault(nome, {})
+            if chave not in serie:
+                serie[chave] = Histograma()
+            serie[chave].observar(valor)
+
+    def incrementar(self, nome: str, valor: float = 1, ajuda: str = "", **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._ajuda.setdefault(nome, ajuda)
+            serie = self._contadores.setdefault(nome, {})
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def exportar(self) -> list:
+        linhas = []
+        with self._lock:
+            for nome, serie in sorted(self._contadores.items()):
+                linhas += [f"# HELP {nome} {self._ajuda[nome]}", f"# TYPE {nome} counter"]
+                for chave, valor in sorted(serie.items()):
+                    linhas.append(f"{nome}{_rotulos(dict(chave))} {valor}")
+
+            for nome, serie in sorted(self._histogramas.items()):
+                linhas += [f"# HELP {nome} {self._ajuda[nome]}", f"# TYPE {nome} histogram"]
+                for chave, hist in sorted(serie.items()):
+                    rotulos = dict(chave)
+                    for limite, contagem in zip(hist.baldes, hist.contagens):
+                        linhas.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': limite})} {contagem}")
+                    linhas.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': '+Inf'})} {hist.total}")
+                    linhas.append(f"{nome}_sum{_rotulos(rotulos)} {hist.soma:.6f}")
+                    linhas.append(f"{nome}_count{_rotulos(rotulos)} {hist.total}")
+        return linhas
+
+
+registro = RegistroMetricas()
+
+
+def gauges(prefixo: str, dados: dict) -> list:
+    """Linhas de gauge para os valores numéricos de um dicionário de estatísticas (aninhados viram prefixo_chave)"""
+    linhas = []
+    for chave, valor in dados.items():
+        nome = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefixo}_{chave}")
+        if isinstance(valor, dict):
+            linhas += gauges(nome, valor)
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+    return linhas
+
+
+# Etapas medidas na requisição atual: [(etapa, segundos)]; None fora de uma requisição.
+# asyncio.to_thread e as tarefas criadas na requisição copiam o contexto, então enxergam a mesma lista.
+_etapas_requisicao = ContextVar("etapas_requisicao", default=None)
+
+
+def registrar_etapa(etapa: str, segundos: float):
+    """Alimenta o histograma da etapa e o Server-Timing da requisição em andamento"""
+    registro.observar("etapa_duracao_segundos", segundos, "Duração de cada etapa da previsão/recomendação",
+                      etapa=etapa)
+    etapas = _etapas_requisicao.get()
+    if etapas is not None:
+        etapas.append((etapa, segundos))
+
+
+@contextmanager
+def medir(etapa: str):
+    """Mede o bloco como uma etapa; exceções também contam em etapa_erros_total"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registro.incrementar("etapa_erros_total", ajuda="Etapas que terminaram com exceção", etapa=etapa)
+        raise
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio)
+
+
+def cronometrado(etapa: str):
+    """Decorador de medir() para funções síncronas e assíncronas"""
+    def decorador(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def envoltorio_async(*args, **kwargs):
+                with medir(etapa):
+                    return await fn(*args, **kwargs)
+            return envoltorio_async
+
+        @functools.wraps(fn)
+        def envoltorio(*args, **kwargs):
+            with medir(etapa):
+                return fn(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+def executar_cronometrado(fn, *args, **kwargs):
+    """(resultado, segundos) de `fn`; roda no processo de ajuste, que devolve a duração ao pai"""
+    inicio = time.perf_counter()
+    resultado = fn(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+
+def server_timing(etapas, total: float) -> str:
+    """Valor do cabeçalho Server-Timing: etapas repetidas são somadas (desc com a contagem)"""
+    somas, contagens = {}, {}
+    for etapa, segundos in etapas:
+        somas[etapa] = somas.get(etapa, 0.0) + segundos
+        contagens[etapa] = contagens.get(etapa, 0) + 1
+    partes = [
+        f"{etapa};dur={s * 1000:.1f}" + (f';desc="{contagens[etapa]}x"' if contagens[etapa] > 1 else "")
+        for etapa, s in somas.items()
+    ]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+class Perfilador:
+    """Perfil de uma requisição: pyinstrument (entende async) quando instalado, senão cProfile.
+
+    O cProfile mede a thread do event loop inteira, então requisições concorrentes
+    aparecem juntas no mesmo perfil. Só um perfil roda por vez.
+    """
+
+    _em_uso = threading.Lock()
+
+    def __init__(self):
+        self._perfil = None
+        self._pyinstrument = False
+
+    def iniciar(self) -> bool:
+        if not Perfilador._em_uso.acquire(blocking=False):
+            return False
+        try:
+            from pyinstrument import Profiler
+            self._perfil = Profiler(async_mode="enabled")
+            self._pyinstrument = True
+        except ImportError:
+            import cProfile
+            self._perfil = cProfile.Profile()
+        if self._pyinstrument:
+            self._perfil.start()
+        else:
+            self._perfil.enable()
+        return True
+
+    def finalizar(self, nome: str) -> str:
+        """Para o perfil e grava o relatório em PERFIL_DIR; devolve o nome do arquivo"""
+        try:
+            if self._pyinstrument:
+                self._perfil.stop()
+                relatorio = self._perfil.output_text(unicode=True)
+            else:
+                import pstats
+                self._perfil.disable()
+                saida = io.StringIO()
+                pstats.Stats(self._perfil, stream=saida).sort_stats("cumulative").print_stats(60)
+                relatorio = saida.getvalue()
+        finally:
+            Perfilador._em_uso.release()
+
+        arquivo = f"{time.strftime('%Y%m%d-%H%M%S')}_{re.sub(r'[^a-zA-Z0-9]+', '_', nome).strip('_')}.txt"
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        with open(os.path.join(PERFIL_DIR, arquivo), "w", encoding="utf-8") as f:
+            f.write(relatorio)
+        return arquivo
+
+
+def deve_perfilar(request) -> bool:
+    """?perfil=1 ou X-Perfil: 1 (com PERFIL_ATIVO), ou sorteio por PERFIL_AMOSTRAGEM"""
+    if PERFIL_ATIVO and (request.query_params.get("perfil") == "1" or request.headers.get("x-perfil") == "1"):
+        return True
+    return PERFIL_AMOSTRAGEM > 0 and random.random() < PERFIL_AMOSTRAGEM
+
+
+async def middleware_metricas(request, call_next):
+    """Duração por rota, Server-Timing com as etapas da requisição e perfil opcional"""
+    etapas = []
+    token = _etapas_requisicao.set(etapas)
+    perfilador = Perfilador() if deve_perfilar(request) else None
+    if perfilador is not None and not perfilador.iniciar():
+        perfilador = None
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        resposta = await call_next(request)
+        status = resposta.status_code
+    finally:
+        total = time.perf_counter() - inicio
+        _etapas_requisicao.reset(token)
+        rota = request.scope.get("route")
+        registro.observar("http_requisicao_duracao_segundos", total, "Duração das requisições HTTP",
+                          rota=rota.path if rota is not None else "desconhecida",
+                          metodo=request.method, status=status)
+        arquivo = None
+        if perfilador is not None:
+            try:
+                arquivo = perfilador.finalizar(request.url.path)
+            except OSError as e:
+                logger.warning(f"Não foi possível gravar o perfil: {e}")
+
+    resposta.headers["Server-Timing"] = server_timing(etapas, total)
+    if arquivo is not None:
+        resposta.headers["X-Perfil"] = arquivo
+    return resposta
@@ -0,0 +1,137 @@
+# Cache em memória dos modelos ajustados, chaveado por (tipo, id_usuario, impressão da série diária).
+# Se nenhuma transação nova entrou, a série tem a mesma impressão e a requisição vai direto para prever().
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE_MAX_ITENS = int(os.getenv("MODEL_CACHE_MAX_ITENS", "128"))
+MODEL_CACHE_TTL = int(os.getenv("MODEL_CACHE_TTL", "3600"))        # segundos
+MODEL_CACHE_MAX_MB = int(os.getenv("MODEL_CACHE_MAX_MB", "256"))
+
+
+def impressao_serie(serie) -> str:
+    """Hash da série diária (valores + primeira/última data)"""
+    h = hashlib.blake2b(digest_size=16)
+    if len(serie):
+        h.update(str(serie.index[0]).encode())
+        h.update(str(serie.index[-1]).encode())
+    h.update(np.ascontiguousarray(serie.to_numpy(dtype="float64")).tobytes())
+    return h.hexdigest()
+
+
+def estimar_tamanho(valor, vistos=None, profundidade: int = 4) -> int:
+    """Tamanho aproximado em bytes: soma o nbytes dos arrays NumPy/pandas alcançáveis a partir do valor.
+
+    Não serializa nada (o pickle de um resultado do statsmodels levava dezenas de ms);
+    arrays compartilhados (também entre chamadas com o mesmo `vistos`) contam uma vez só.
+    """
+    vistos = set() if vistos is None else vistos
+    if id(valor) in vistos:
+        return 0
+    vistos.add(id(valor))
+
+    if isinstance(valor, np.ndarray):
+        return 0 if valor.base is not None and id(valor.base) in vistos else valor.nbytes
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True))
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True).sum())
+    if isinstance(valor, pd.Index):
+        return valor.nbytes
+    if profundidade == 0:
+        return 0
+    if isinstance(valor, (list, tuple)):
+        return sum(estimar_tamanho(v, vistos, profundidade - 1) for v in valor)
+    if isinstance(valor, dict):
+        return sum(estimar_tamanho(v, vistos, profundidade - 1) for v in valor.values())
+    if hasattr(valor, "__dict__"):
+        return sum(estimar_tamanho(v, vistos, profundidade - 1) for v in vars(valor).values())
+    return 0
+
+
+class CacheModelos:
+    """LRU com TTL e limite de memória, com contadores de acerto/erro/despejo"""
+
+    def __init__(self, max_itens: int = MODEL_CACHE_MAX_ITENS, ttl: int = MODEL_CACHE_TTL,
+                 max_bytes: int = MODEL_CACHE_MAX_MB * 1024 * 1024, medir=estimar_tamanho):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.medir = medir  # valor -> bytes, quando guardar() não recebe o tamanho
+        self._itens = OrderedDict()  # chave -> (valor, expira_em, tamanho)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.erros = 0
+        self.despejos = 0
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.erros += 1
+                return None
+
+            valor, expira_em, _ = item
+            if expira_em < time.monotonic():
+                self._remover(chave)
+                self.despejos += 1
+                self.erros += 1
+                return None
+
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave, valor, tamanho: int = None):
+        if tamanho is None:
+            tamanho = self.medir(valor)
+        if tamanho > self.max_bytes:
+            logger.warning(f"Modelo de {tamanho} bytes maior que o limite do cache, ignorado")
+            return
+
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, time.monotonic() + self.ttl, tamanho)
+            self._bytes += tamanho
+
+            # Despeja os menos usados até caber nos limites
+            while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+                antiga, _ = next(iter(self._itens.items()))
+                self._remover(antiga)
+                self.despejos += 1
+
+    def _remover(self, chave):
+        _, _, tamanho = self._itens.pop(chave)
+        self._bytes -= tamanho
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'bytes': self._bytes,
+                'max_itens': self.max_itens,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'acertos': self.acertos,
+                'erros': self.erros,
+                'despejos': self.despejos
+            }
+
+
+# Instância global do cache de modelos
+cache_modelos = CacheModelos()
@@ -1,17 +1,103 @@
-from forecasting.arima_model import treinar_arima, avaliar_arima
-from forecasting.sarima_model import treinar_sarima, avaliar_sarima
+from forecasting.arima_model import avaliar_arima
+from forecasting.sarima_model import avaliar_sarima
+from forecasting.baseline_model import ModeloBaseline
+from forecasting.backtest import BACKTEST_DOBRAS, BACKTEST_PASSO, backtest_baselines, cortes_dobras
+import pandas as pd
+import numpy as np
+import logging
+import os
 
-def selecionar_melhor_modelo(serie):
-    arima_model = treinar_arima(serie)
-    sarima_model = treinar_sarima(serie)
+logger = logging.getLogger(__name__)
 
-    rmse_arima = avaliar_arima(arima_model, serie)
-    rmse_sarima = avaliar_sarima(sarima_model, serie)
+# Abaixo disso (em dias) a série fica só com as baselines
+SELECAO_MIN_DIAS = int(os.getenv("SELECAO_MIN_DIAS", "28"))
+# Fração de dias zerados a partir da qual ARIMA/SARIMA não compensam
+SELECAO_MAX_ZEROS = float(os.getenv("SELECAO_MAX_ZEROS", "0.6"))
+# Pula o statsmodels se a melhor baseline já erra menos que essa fração do nível médio do holdout
+SELECAO_TOLERANCIA_BASELINE = float(os.getenv("SELECAO_TOLERANCIA_BASELINE", "0.1"))
 
-    if rmse_arima <= rmse_sarima:
-        melhor_modelo = arima_model.fit()
-        return melhor_modelo, "ARIMA"
-    else:
-        melhor_modelo = sarima_model.fit(disp=False)
-        return melhor_modelo, "SARIMA"
+def _como_serie(serie):
+    # Aceita tanto a Series quanto o DataFrame devolvido por carregar_dados_transacao
+    if isinstance(serie, pd.DataFrame):
+        return serie["valor"]
+    return serie
 
+def _estender(fitted, serie, restante):
+    """Estende o vencedor com os dias após a janela de treino reaproveitando os parâmetros já estimados."""
+    try:
+        return fitted.append(restante)
+    except Exception as e:
+        # append exige índice contínuo; se não der, reaplica os mesmos parâmetros na série toda
+        logger.warning(f"append falhou ({e}), reaplicando parâmetros na série completa")
+        return fitted.apply(serie)
+
+def _baseline_basta(serie, teste, rmse_baseline):
+    """Série curta, quase toda zerada, ou baseline já boa o bastante: não vale ajustar ARIMA/SARIMA"""
+    if len(serie) < SELECAO_MIN_DIAS:
+        return True
+    if (serie.to_numpy() == 0).mean() > SELECAO_MAX_ZEROS:
+        return True
+    nivel = np.abs(teste.to_numpy()).mean()
+    return nivel > 0 and rmse_baseline <= SELECAO_TOLERANCIA_BASELINE * nivel
+
+def preparar_selecao(serie, horizon=15, dobras=BACKTEST_DOBRAS, passo=BACKTEST_PASSO):
+    """Dobras do backtest e scores das baselines, comuns à seleção síncrona e à seleção com prazo.
+
+    Os scores são o RMSE médio nas `dobras` origens móveis (ver backtest).
+    Retorna (serie, horizon, restante, scores, melhor_baseline, baseline_basta),
+    onde `restante` são os dias após a janela de treino da primeira dobra.
+    """
+    serie = _como_serie(serie)
+    # Séries curtas: o holdout não pode engolir a janela de treino
+    horizon = min(horizon, max(1, len(serie) // 3))
+    cortes = cortes_dobras(len(serie), dobras, horizon, passo)
+
+    scores = backtest_baselines(serie.to_numpy(), cortes, horizon)
+    melhor_baseline = min(scores, key=scores.get)
+    basta = _baseline_basta(serie, serie[-horizon:], scores[melhor_baseline])
+    return serie, horizon, serie[cortes[0]:], scores, melhor_baseline, basta
+
+def avaliar_candidato(nome, serie, horizon=15, ordens=None, maxiter=None,
+                      dobras=BACKTEST_DOBRAS, passo=BACKTEST_PASSO, detalhado=False):
+    """Ajusta um candidato estatístico ("ARIMA"/"SARIMA") uma vez e o avalia nas dobras; retorna (fit, rmse)"""
+    avaliar = avaliar_arima if nome == "ARIMA" else avaliar_sarima
+    return avaliar(serie, horizon, maxiter=maxiter, dobras=dobras, passo=passo, detalhado=detalhado, **(ordens or {}))
+
+def escolher_vencedor(serie, restante, scores, fits, melhor_baseline):
+    """Melhor entre os candidatos ajustados e a melhor baseline; retorna (modelo, nome)"""
+    candidatos = {nome: fit for nome, fit in fits.items() if fit is not None}
+    if not candidatos:
+        # Nenhum candidato convergiu no treino: fica com a melhor baseline
+        logger.warning("Nenhum candidato ajustou no treino, usando a melhor baseline")
+        return ModeloBaseline(melhor_baseline, serie), melhor_baseline
+
+    # Em caso de empate o ARIMA (mais barato) continua tendo preferência
+    ordem = [n for n in ("ARIMA", "SARIMA") if n in candidatos]
+    nome = min(ordem, key=lambda n: np.nan_to_num(scores[n], nan=np.inf))
+    if scores[melhor_baseline] < scores[nome]:
+        return ModeloBaseline(melhor_baseline, serie), melhor_baseline
+    return _estender(candidatos[nome], serie, restante), nome
+
+def selecionar_melhor_modelo(serie, horizon=15, ordens=None):
+    """Escolhe entre baselines, ARIMA e SARIMA pelo erro médio de um backtest com origem móvel.
+
+    As baselines vetorizadas são avaliadas primeiro; se a série é curta/esparsa
+    ou uma baseline já está dentro da tolerância, os ajustes do statsmodels são
+    pulados. Cada candidato é ajustado uma única vez na janela de treino da
+    primeira dobra e estendido pelas demais; só o vencedor é estendido até o fim. `ordens` ({"ARIMA": {...}, "SARIMA": {...}},
+    vindo de order_search) substitui as ordens padrão. Retorna (modelo_ajustado,
+    nome, scores), onde scores tem o RMSE médio das dobras de cada candidato avaliado.
+    """
+    ordens = ordens or {}
+    serie, horizon, restante, scores, melhor_baseline, basta = preparar_selecao(serie, horizon)
+
+    if basta:
+        logger.info(f"Baseline {melhor_baseline} escolhida sem ajustar ARIMA/SARIMA")
+        return ModeloBaseline(melhor_baseline, serie), melhor_baseline, scores
+
+    fits = {}
+    for nome in ("ARIMA", "SARIMA"):
+        fits[nome], scores[nome] = avaliar_candidato(nome, serie, horizon, ordens.get(nome))
+
+    modelo, nome = escolher_vencedor(serie, restante, scores, fits, melhor_baseline)
+    return modelo, nome, scores
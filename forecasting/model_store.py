@@ -0,0 +1,248 @@
+# Armazenamento em disco dos modelos ajustados, para que o primeiro request depois de um restart
+# (o plano gratuito do Render dorme e reinicia com frequência) não refaça a seleção do zero.
+# Em vez do pickle do resultado do statsmodels (centenas de KB, com todas as saídas do filtro),
+# cada registro guarda só a especificação do modelo, os parâmetros estimados e a série; na carga
+# o modelo é reconstruído e filtrado com os mesmos parâmetros, sem passar pelo MLE.
+# O registro é um .npz (arrays + metadados em JSON) lido sem pickle: um arquivo estranho no
+# diretório não executa nada na carga.
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting.baseline_model import BASELINES, ModeloBaseline
+from forecasting.disk_store import ArmazemDisco
+from forecasting.model_cache import impressao_serie
+
+logger = logging.getLogger(__name__)
+
+MODEL_STORE_ATIVO = os.getenv("MODEL_STORE_ATIVO", "True") == "True"
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", ".model_store")
+MODEL_STORE_MAX_MB = int(os.getenv("MODEL_STORE_MAX_MB", "100"))
+
+# Muda quando o formato do registro mudar; registros de outra versão são ignorados
+VERSAO_REGISTRO = 2
+
+
+def especificacao(modelo) -> dict:
+    """Classe e ordens do modelo, o suficiente para reconstruí-lo sobre a mesma série"""
+    if isinstance(modelo, ModeloBaseline):
+        return {"classe": "BASELINE", "nome": modelo.nome}
+    interno = modelo.model
+    return {
+        "classe": type(interno).__name__,
+        "order": tuple(interno.order),
+        "seasonal_order": tuple(interno.seasonal_order),
+        "trend": getattr(interno, "trend", None)
+    }
+
+
+def rotulo_especificacao(spec: dict) -> str:
+    """Forma curta da especificação, usada no nome do arquivo (ex.: ARIMA-1.1.1-0.0.0.0)"""
+    if spec["classe"] == "BASELINE":
+        return spec["nome"]
+    ordens = ".".join(map(str, spec["order"])) + "-" + ".".join(map(str, spec["seasonal_order"]))
+    return f"{spec['classe']}-{ordens}"
+
+
+def especificacao_valida(spec, params) -> bool:
+    """A especificação e os parâmetros lidos do disco descrevem um modelo que sabemos reconstruir"""
+    if not isinstance(spec, dict):
+        return False
+    if spec.get("classe") == "BASELINE":
+        return spec.get("nome") in BASELINES
+    if spec.get("classe") not in ("ARIMA", "SARIMAX") or spec.get("trend") not in (None, "n", "c", "t", "ct"):
+        return False
+    ordens = (spec.get("order"), spec.get("seasonal_order"))
+    if not all(isinstance(o, (list, tuple)) and all(isinstance(v, int) and v >= 0 for v in o) for o in ordens):
+        return False
+    return (len(ordens[0]) == 3 and len(ordens[1]) == 4 and params is not None and params.ndim == 1
+            and len(params) > 0 and bool(np.isfinite(params).all()))
+
+
+def filtro_enxuto() -> dict:
+    """Argumentos de filter/append/apply que não guardam as saídas do filtro a cada passo.
+
+    Ficam só as previsões um passo à frente e o último estado, que bastam para forecast,
+    get_forecast (com intervalos), append e apply; um SARIMA de alguns anos cai de
+    dezenas de MB para centenas de KB.
+    """
+    from statsmodels.tsa.statespace import kalman_filter as kf
+    return {"conserve_memory": (kf.MEMORY_NO_FILTERED | kf.MEMORY_NO_PREDICTED | kf.MEMORY_NO_GAIN
+                                | kf.MEMORY_NO_SMOOTHING | kf.MEMORY_NO_LIKELIHOOD)}
+
+
+def reconstruir_modelo(spec: dict, params, serie):
+    """Modelo enxuto pronto para forecast/append a partir da especificação e dos parâmetros (só filtra)"""
+    if spec["classe"] == "BASELINE":
+        return ModeloBaseline(spec["nome"], serie)
+    if spec["classe"] == "ARIMA":
+        from statsmodels.tsa.arima.model import ARIMA
+        modelo = ARIMA(serie, order=spec["order"], seasonal_order=spec["seasonal_order"], trend=spec["trend"])
+    else:
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+        modelo = SARIMAX(serie, order=spec["order"], seasonal_order=spec["seasonal_order"], trend=spec["trend"])
+    return modelo.filter(np.asarray(params), cov_type="none", **filtro_enxuto())
+
+
+def enxugar_modelo(modelo, serie=None):
+    """Mesmo modelo (especificação e parâmetros) refiltrado enxuto em `serie` (padrão: a do próprio ajuste).
+
+    Baselines sem `serie` ficam como estão.
+    """
+    if isinstance(modelo, ModeloBaseline):
+        return modelo if serie is None else modelo.apply(serie)
+    serie = modelo.model.data.orig_endog if serie is None else serie
+    return reconstruir_modelo(especificacao(modelo), modelo.params, serie)
+
+
+def serializar_estado(estado) -> dict:
+    """Registro compacto de um estado de incremental.novo_estado (arrays + metadados em JSON)"""
+    modelo = estado["modelo"]
+    serie = estado["serie"]
+    return {
+        "versao": VERSAO_REGISTRO,
+        "spec": especificacao(modelo),
+        "params": None if isinstance(modelo, ModeloBaseline) else np.asarray(modelo.params, dtype="float64"),
+        "inicio": serie.index[0].strftime("%Y-%m-%d"),
+        "valores": serie.to_numpy(dtype="float64"),
+        "nome": estado["nome"],
+        "scores": {nome: float(score) for nome, score in estado["scores"].items()},
+        # ajustado_em é monotônico e não sobrevive ao restart; guarda o horário de parede equivalente
+        "ajustado_em_parede": time.time() - (time.monotonic() - estado["ajustado_em"])
+    }
+
+
+def serie_do_registro(registro) -> pd.Series:
+    return pd.Series(registro["valores"],
+                     index=pd.date_range(registro["inicio"], periods=len(registro["valores"]), freq="D"))
+
+
+def desserializar_estado(registro, serie=None) -> dict:
+    serie = serie_do_registro(registro) if serie is None else serie
+    return {
+        "serie": serie,
+        "modelo": reconstruir_modelo(registro["spec"], registro["params"], serie),
+        "nome": registro["nome"],
+        "scores": registro["scores"],
+        "ajustado_em": time.monotonic() - max(0.0, time.time() - registro["ajustado_em_parede"])
+    }
+
+
+def gravar_registro(arquivo, registro):
+    metadados = {k: v for k, v in registro.items() if k not in ("params", "valores")}
+    params = registro["params"] if registro["params"] is not None else np.empty(0)
+    np.savez(arquivo, meta=np.array(json.dumps(metadados)), params=params, valores=registro["valores"])
+
+
+def ler_registro(caminho) -> dict:
+    """Registro gravado por gravar_registro; np.load sem pickle, então o arquivo não executa código"""
+    with np.load(caminho, allow_pickle=False) as dados:
+        registro = json.loads(str(dados["meta"]))
+        registro["valores"] = np.asarray(dados["valores"], dtype="float64")
+        registro["params"] = np.asarray(dados["params"], dtype="float64")
+    spec = registro.get("spec")
+    if isinstance(spec, dict):
+        # JSON devolve listas; especificacao() usa tuplas
+        for campo in ("order", "seasonal_order"):
+            if isinstance(spec.get(campo), list):
+                spec[campo] = tuple(spec[campo])
+        if spec.get("classe") == "BASELINE":
+            registro["params"] = None
+    return registro
+
+
+def serie_compativel(guardada, serie) -> bool:
+    """A série do registro é o começo de `serie`: mesmo início, não mais longa e dias iguais.
+
+    O último dia guardado pode ter sido parcial e fica de fora da comparação.
+    """
+    n = len(guardada)
+    return (n > 0 and len(serie) >= n and guardada.index[0] == serie.index[0]
+            and np.array_equal(guardada.to_numpy()[:-1], serie.to_numpy(dtype="float64")[:n - 1]))
+
+
+class ArmazemModelos(ArmazemDisco):
+    """Um registro por (tipo, id_usuario) em disco, com limite de tamanho e despejo do mais antigo.
+
+    O nome do arquivo leva a chave (com a identidade do banco), a marca d'água e a
+    impressão da série e a especificação do modelo. O diretório só é listado no
+    primeiro uso e cada registro só é lido quando pedido.
+    """
+
+    extensao = ".npz"
+    descricao = "Armazém de modelos"
+
+    def __init__(self, diretorio: str = MODEL_STORE_DIR, max_bytes: int = MODEL_STORE_MAX_MB * 1024 * 1024,
+                 banco: str = None):
+        super().__init__(diretorio, max_bytes, banco)
+        self.carregados = 0
+        self.gravados = 0
+        self.incompativeis = 0
+
+    def _ler_nome(self, nome: str):
+        # {prefixo}__{AAAAMMDD}__{impressão}__{especificação}.npz -> (prefixo, impressão)
+        prefixo, _, impressao, _ = nome[:-len(".npz")].split("__")
+        return prefixo, impressao
+
+    def carregar(self, chave, serie=None):
+        """Estado guardado para a chave (modelo reconstruído), ou None.
+
+        O registro só é aceito com especificação válida e com a série que bate com a
+        impressão do nome do arquivo; com `serie`, a guardada ainda precisa ser o
+        começo dela (senão o modelo é de outros dados e a seleção é refeita).
+        """
+        prefixo = self._prefixo(chave)
+        item = self._entrada(prefixo)
+        if item is None:
+            return None
+        caminho, _, _, impressao = item
+        try:
+            registro = ler_registro(caminho)
+            guardada = serie_do_registro(registro)
+            if (registro.get("versao") != VERSAO_REGISTRO
+                    or not especificacao_valida(registro.get("spec"), registro["params"])
+                    or impressao_serie(guardada)[:12] != impressao):
+                raise ValueError("versão, especificação ou impressão da série não conferem")
+        except Exception as e:
+            logger.warning(f"Registro de modelo inválido em {caminho}, descartado: {e}")
+            self._apagar(prefixo)
+            return None
+        if serie is not None and not serie_compativel(guardada, serie):
+            self.incompativeis += 1
+            return None
+        try:
+            estado = desserializar_estado(registro, guardada)
+        except Exception as e:
+            logger.warning(f"Registro de modelo ilegível em {caminho}, descartado: {e}")
+            self._apagar(prefixo)
+            return None
+        self.carregados += 1
+        return estado
+
+    def guardar(self, chave, estado):
+        """Grava o estado substituindo o registro anterior da mesma chave"""
+        registro = serializar_estado(estado)
+        serie = estado["serie"]
+        prefixo = self._prefixo(chave)
+        impressao = impressao_serie(serie)[:12]
+        nome = f"{prefixo}__{serie.index[-1]:%Y%m%d}__{impressao}__{rotulo_especificacao(registro['spec'])}.npz"
+        caminho = os.path.join(self.diretorio, nome)
+
+        self._gravar(caminho, lambda f: gravar_registro(f, registro))
+        self._registrar(prefixo, caminho, impressao)
+        self.gravados += 1
+
+    def _contadores(self) -> dict:
+        return {
+            'carregados': self.carregados,
+            'gravados': self.gravados,
+            'incompativeis': self.incompativeis
+        }
+
+
+# Instância global do armazém de modelos
+armazem_modelos = ArmazemModelos()
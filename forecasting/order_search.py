@@ -0,0 +1,157 @@
+# Busca automática das ordens (p,d,q)(P,D,Q,s) do ARIMA/SARIMA.
+# A grade é dividida em lotes que rodam em paralelo nos processos do executor de ajustes (mesma fila
+# limitada e mesmo corte por prazo dos demais ajustes), com maxiter limitado e orçamento de tempo por
+# busca; candidatos que falham ou não convergem são descartados.
+# A ordem escolhida fica em cache por chave da série, então os reajustes seguintes pulam a busca.
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting.executor import FilaCheiaError
+from forecasting.model_cache import CacheModelos
+from forecasting.model_selector import SELECAO_MIN_DIAS
+
+logger = logging.getLogger(__name__)
+
+ORDEM_AUTO = os.getenv("ORDEM_AUTO", "True") == "True"
+ORDEM_CRITERIO = os.getenv("ORDEM_CRITERIO", "rmse")          # "rmse" (holdout) ou "aic"
+ORDEM_ORCAMENTO = float(os.getenv("ORDEM_ORCAMENTO", "20"))   # segundos por busca
+ORDEM_MAXITER = int(os.getenv("ORDEM_MAXITER", "50"))
+ORDEM_VALIDADE = int(os.getenv("ORDEM_VALIDADE", str(7 * 24 * 3600)))  # segundos até buscar de novo
+
+# (tipo, id_usuario) -> {"ARIMA": {"order": ...}, "SARIMA": {"order": ..., "seasonal_order": ...}}
+ordens_escolhidas = CacheModelos(max_itens=4096, ttl=ORDEM_VALIDADE)
+
+
+def gerar_grade(p=(0, 1, 2), d=(0, 1), q=(0, 1, 2), P=(0, 1), D=(1,), Q=(0, 1), s=7,
+                p_sazonal=(0, 1), q_sazonal=(0, 1)):
+    """Candidatos (order, seasonal_order): não sazonais para o ARIMA e sazonais (d=1) para o SARIMA"""
+    grade = [((pi, di, qi), (0, 0, 0, 0)) for pi, di, qi in itertools.product(p, d, q)]
+    grade += [
+        ((pi, 1, qi), (Pi, Di, Qi, s))
+        for pi, qi, Pi, Di, Qi in itertools.product(p_sazonal, q_sazonal, P, D, Q)
+    ]
+    return grade
+
+
+def _ajustar_candidato(serie, order, seasonal_order, criterio, horizon, maxiter):
+    """Ajusta um candidato e devolve seu score; None se falhar ou não convergir.
+
+    Usa a mesma especificação que serve o modelo escolhido: ARIMA (com constante
+    quando d=0) para os não sazonais e SARIMAX para os sazonais.
+    """
+    from forecasting.arima_model import treinar_arima
+    from forecasting.sarima_model import treinar_sarima
+
+    treino = serie[:-horizon] if criterio == "rmse" else serie
+
+    try:
+        if seasonal_order[3] == 0:
+            fitted = treinar_arima(treino, order).fit(method_kwargs={"maxiter": maxiter})
+        else:
+            fitted = treinar_sarima(treino, order, seasonal_order).fit(disp=False, maxiter=maxiter)
+    except Exception:
+        return None
+    if not fitted.mle_retvals.get("converged", True):
+        return None
+
+    if criterio == "aic":
+        score = fitted.aic
+    else:
+        preds = np.asarray(fitted.forecast(steps=horizon))
+        score = np.sqrt(np.mean((serie.to_numpy()[-horizon:] - preds) ** 2))
+    return float(score) if np.isfinite(score) else None
+
+
+def _avaliar_lote(valores, inicio, candidatos, criterio, horizon, maxiter, limite):
+    """Roda no processo de ajuste: avalia os candidatos em sequência até o limite.
+
+    `limite` é um instante de time.monotonic(), que no Linux é o mesmo relógio em todos os processos.
+    Um candidato só começa se, pelo mais lento até agora, ainda termina antes do limite;
+    assim o lote devolve o que avaliou em vez de ser morto pelo prazo. Retorna
+    [(order, seasonal_order, score ou None)] dos candidatos avaliados.
+    """
+    serie = pd.Series(valores, index=pd.date_range(inicio, periods=len(valores), freq="D"))
+    avaliados = []
+    mais_lento = 0.0
+    for order, sazonal in candidatos:
+        comeco = time.monotonic()
+        if comeco + mais_lento > limite:
+            break
+        avaliados.append((order, sazonal, _ajustar_candidato(serie, order, sazonal, criterio, horizon, maxiter)))
+        mais_lento = max(mais_lento, time.monotonic() - comeco)
+    return avaliados
+
+
+async def buscar_ordem(serie, executor, grade=None, criterio: str = ORDEM_CRITERIO,
+                       orcamento: float = ORDEM_ORCAMENTO, horizon: int = 15, maxiter: int = ORDEM_MAXITER) -> dict:
+    """Avalia a grade em paralelo e retorna as melhores ordens encontradas dentro do orçamento.
+
+    A grade é dividida em `executor.workers` lotes, cada um uma chamada de
+    executor.executar_com_prazo (um processo morto se passar do orçamento).
+    Levanta FilaCheiaError se a fila não aceitou nenhum lote. Retorna
+    {"ARIMA": {...}, "SARIMA": {...}}, só com os modelos para os quais algum
+    candidato convergiu.
+    """
+    grade = grade or gerar_grade()
+    horizon = min(horizon, max(1, len(serie) // 3))
+    valores = serie.to_numpy(dtype="float64")
+    inicio = serie.index[0]
+
+    n_lotes = max(1, min(executor.workers, len(grade)))
+    # Intercalados, para cada lote ter candidatos ARIMA e SARIMA
+    lotes = [grade[i::n_lotes] for i in range(n_lotes)]
+    comeco = time.monotonic()
+    limite = comeco + orcamento
+    resultados = await asyncio.gather(*(
+        executor.executar_com_prazo(_avaliar_lote, valores, inicio, lote, criterio, horizon, maxiter, limite,
+                                    prazo=orcamento)
+        for lote in lotes
+    ), return_exceptions=True)
+
+    if all(isinstance(r, FilaCheiaError) for r in resultados):
+        raise resultados[0]
+
+    melhores = {}
+    avaliados = descartados = 0
+    for resultado in resultados:
+        if isinstance(resultado, BaseException):
+            logger.warning(f"Lote da busca de ordem perdido: {resultado!r}")
+            continue
+        for order, sazonal, score in resultado:
+            avaliados += 1
+            if score is None:
+                descartados += 1
+                continue
+            nome = "SARIMA" if sazonal[3] else "ARIMA"
+            if nome not in melhores or score < melhores[nome][0]:
+                melhores[nome] = (score, order, sazonal)
+
+    logger.info(
+        f"Busca de ordem: {avaliados}/{len(grade)} candidatos em {time.monotonic() - comeco:.1f}s, "
+        f"{descartados} descartados, {len(grade) - avaliados} fora do orçamento"
+    )
+
+    ordens = {}
+    if "ARIMA" in melhores:
+        ordens["ARIMA"] = {"order": melhores["ARIMA"][1]}
+    if "SARIMA" in melhores:
+        ordens["SARIMA"] = {"order": melhores["SARIMA"][1], "seasonal_order": melhores["SARIMA"][2]}
+    return ordens
+
+
+async def obter_ordens(chave, serie, executor, orcamento: float = ORDEM_ORCAMENTO) -> dict:
+    """Ordens em cache para a chave da série; sem cache, roda a busca no executor e guarda o resultado"""
+    if len(serie) < SELECAO_MIN_DIAS:
+        # Série curta fica só com as baselines; a busca roda quando ela crescer
+        return {}
+    ordens = ordens_escolhidas.obter(chave)
+    if ordens is None:
+        ordens = await buscar_ordem(serie, executor, orcamento=orcamento)
+        ordens_escolhidas.guardar(chave, ordens, tamanho=0)
+    return ordens
@@ -1,32 +1,129 @@
 # Gera o gráfico JSON com série histórica e previsões (data/previsao)
-import plotly.graph_objects as go
+# Dois formatos: "plotly" (traces prontos do plotly) e "compacto" (histórico reduzido com LTTB,
+# eixo x como data inicial + passo diário, montado direto dos arrays NumPy sem objetos do plotly).
+import os
+
+import numpy as np
+import orjson
+
+# Pontos do histórico no formato compacto
+GRAFICO_PONTOS = int(os.getenv("GRAFICO_PONTOS", "500"))
+# Níveis das faixas de incerteza, incluídas quando a requisição pede bandas=true
+GRAFICO_NIVEIS = tuple(float(n) for n in os.getenv("GRAFICO_NIVEIS", "0.8,0.95").split(",") if n.strip())
+
+LAYOUT = {
+    "title": "Previsão de Receita/Despesa",
+    "xaxis": {"title": "Data"},
+    "yaxis": {"title": "Valor"},
+    "template": "plotly_white"
+}
+
+def _bandas(previsao_df):
+    # Colunas inferior_XX/superior_XX de prever(..., niveis) -> [(XX, inferior, superior)], da mais larga à mais estreita
+    rotulos = sorted((int(c.split("_")[1]) for c in previsao_df.columns if c.startswith("inferior_")), reverse=True)
+    bandas = [(r, previsao_df[f"inferior_{r}"].to_numpy(dtype="float64"),
+               previsao_df[f"superior_{r}"].to_numpy(dtype="float64")) for r in rotulos]
+    # Série curta demais para ter resíduos: sem faixa
+    return [banda for banda in bandas if np.isfinite(banda[1]).all() and np.isfinite(banda[2]).all()]
 
 def gerar_grafico_forecast_json(serie_real, previsao_df):
+    # plotly é importado só na primeira montagem do gráfico
+    import plotly.graph_objects as go
+
     # Converte tudo para tipos compatíveis com JSON
     trace_real = go.Scatter(
-        x=serie_real.index.astype(str).tolist(),  
-        y=serie_real.values.tolist(),             
+        x=serie_real.index.astype(str).tolist(),
+        y=serie_real.values.tolist(),
         mode='lines',
         name='Histórico',
         line=dict(color='blue')
     )
 
     trace_forecast = go.Scatter(
-        x=previsao_df['data'].astype(str).tolist(),      
-        y=previsao_df['previsao'].tolist(),              
+        x=previsao_df['data'].astype(str).tolist(),
+        y=previsao_df['previsao'].tolist(),
         mode='lines',
         name='Previsão',
         line=dict(color='orange', dash='dash')
     )
 
-    layout = {
-        "title": "Previsão de Receita/Despesa",
-        "xaxis": {"title": "Data"},
-        "yaxis": {"title": "Valor"},
-        "template": "plotly_white"
-    }
+    # Faixas de incerteza: limite inferior invisível + superior preenchido até ele
+    x_previsao = previsao_df['data'].astype(str).tolist()
+    traces_bandas = []
+    for rotulo, inferior, superior in _bandas(previsao_df):
+        traces_bandas.append(go.Scatter(x=x_previsao, y=inferior.tolist(), mode='lines',
+                                        line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        traces_bandas.append(go.Scatter(x=x_previsao, y=superior.tolist(), mode='lines', fill='tonexty',
+                                        fillcolor='rgba(255,165,0,0.2)', line=dict(width=0),
+                                        name=f'Intervalo {rotulo}%'))
 
     return {
-        "data": [trace_real.to_plotly_json(), trace_forecast.to_plotly_json()],
-        "layout": layout
+        "data": [trace_real.to_plotly_json()] + [t.to_plotly_json() for t in traces_bandas]
+                + [trace_forecast.to_plotly_json()],
+        "layout": LAYOUT
     }
+
+def lttb(y, alvo: int):
+    """Índices escolhidos pelo Largest-Triangle-Three-Buckets para `alvo` pontos (x = 0..n-1).
+
+    Mantém o primeiro e o último ponto; em cada balde fica o ponto que forma o
+    maior triângulo com o ponto escolhido no balde anterior e a média do seguinte.
+    """
+    y = np.asarray(y, dtype="float64")
+    n = len(y)
+    if alvo >= n or alvo < 3:
+        return np.arange(n)
+
+    # Limites dos baldes internos (o primeiro e o último ponto ficam fora)
+    limites = (np.floor(np.arange(alvo - 1) * (n - 2) / (alvo - 2)).astype(int) + 1)
+    limites[-1] = n - 1
+    acumulado = np.concatenate(([0.0], np.cumsum(y)))
+
+    escolhidos = np.empty(alvo, dtype=int)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    a = 0
+    for i in range(alvo - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        # Média do balde seguinte (o último balde usa o ponto final)
+        prox_inicio, prox_fim = fim, (limites[i + 2] if i + 2 < len(limites) else n)
+        media_x = (prox_inicio + prox_fim - 1) / 2
+        media_y = (acumulado[prox_fim] - acumulado[prox_inicio]) / (prox_fim - prox_inicio)
+
+        xs = np.arange(inicio, fim)
+        areas = np.abs((a - media_x) * (y[inicio:fim] - y[a]) - (a - xs) * (media_y - y[a]))
+        a = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = a
+    return escolhidos
+
+def gerar_grafico_compacto(serie_real, previsao_df, pontos: int = GRAFICO_PONTOS):
+    """Payload compacto: histórico reduzido com LTTB, eixo x como início + passo diário.
+
+    `historico.x` (deslocamentos em dias a partir de `inicio`) só aparece quando
+    o histórico foi reduzido; sem ele os pontos são consecutivos. Com intervalos
+    na previsão, `previsao.bandas` traz {"80": {"inferior", "superior"}, ...}.
+    """
+    valores = serie_real.to_numpy(dtype="float64")
+    historico = {"inicio": None, "passo_dias": 1, "total": len(valores), "y": np.round(valores, 2)}
+    if len(valores):
+        historico["inicio"] = serie_real.index[0].strftime("%Y-%m-%d")
+        if len(valores) > pontos:
+            indices = lttb(valores, pontos)
+            historico["x"] = indices
+            historico["y"] = historico["y"][indices]
+
+    previsao = {"inicio": None, "passo_dias": 1,
+                "y": np.round(previsao_df["previsao"].to_numpy(dtype="float64"), 2)}
+    if len(previsao_df):
+        previsao["inicio"] = previsao_df["data"].iloc[0].strftime("%Y-%m-%d")
+    bandas = _bandas(previsao_df)
+    if bandas:
+        previsao["bandas"] = {
+            str(rotulo): {"inferior": np.round(inferior, 2), "superior": np.round(superior, 2)}
+            for rotulo, inferior, superior in bandas
+        }
+
+    return {"formato": "compacto", "historico": historico, "previsao": previsao, "layout": LAYOUT}
+
+def serializar_json(payload) -> bytes:
+    """JSON em bytes; o orjson serializa os arrays NumPy direto, sem virar listas (NaN vira null)"""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
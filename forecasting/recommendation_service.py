@@ -1,53 +1,185 @@
 from sqlalchemy import text
-from database import get_session
-from forecasting.forecasting_service import executar_previsao_completa
+from database import DB_ASYNC, execute_with_retry, execute_with_retry_async
+from forecasting.forecasting_service import FILTRO_USUARIO_SQL
+from forecasting.model_cache import CacheModelos
+from forecasting.coalescer import Coalescedor
+from forecasting.metrics import cronometrado, medir
+import asyncio
+import hashlib
 import os
+import time
 import requests
 import json
 import logging
-import google.generativeai as genai
 
 logger = logging.getLogger(__name__)
+
+GEMINI_MODELO = os.getenv("GEMINI_MODELO", "gemini-2.5-pro")
+# "gemini" (padrão) ou "stub" para testes/testes de carga sem chamar a API
+RECOMENDACAO_BACKEND = os.getenv("RECOMENDACAO_BACKEND", "gemini")
+RECOMENDACAO_TIMEOUT = float(os.getenv("RECOMENDACAO_TIMEOUT", "30"))      # segundos
+RECOMENDACAO_CACHE_TTL = int(os.getenv("RECOMENDACAO_CACHE_TTL", "3600"))  # segundos
+RECOMENDACAO_CACHE_MAX_ITENS = int(os.getenv("RECOMENDACAO_CACHE_MAX_ITENS", "256"))
+
+RESUMO_TTL = int(os.getenv("RESUMO_TTL", "60"))                # segundos sem nem conferir a marca d'água
+RESUMO_MAX_IDADE = int(os.getenv("RESUMO_MAX_IDADE", "900"))   # recalcula mesmo sem mudança na marca d'água
+MARCA_TTL = int(os.getenv("MARCA_TTL", "5"))                    # segundos reaproveitando a marca d'água consultada
+
+# Marca d'água barata (só MAX em colunas indexadas): muda quando entram transações ou vendas novas
+_SQL_MARCA = """
+    (SELECT MAX(data) FROM transacoes) AS marca_transacoes,
+    (SELECT MAX(id) FROM itens_venda) AS marca_itens
+"""
+
+_cache_marca = CacheModelos(max_itens=1, ttl=MARCA_TTL)
+
+def carregar_marca() -> tuple:
+    """(última data de transação, último item de venda); usada no cache do resumo e nos ETags"""
+    marca = _cache_marca.obter("marca")
+    if marca is None:
+        marca = execute_with_retry(lambda session: tuple(session.execute(text(f"SELECT {_SQL_MARCA}")).one()))
+        _cache_marca.guardar("marca", marca, tamanho=0)
+    return marca
+
+async def carregar_marca_async() -> tuple:
+    """carregar_marca pelo engine assíncrono (DB_ASYNC); sem ele a versão síncrona roda numa thread"""
+    if not DB_ASYNC:
+        return await asyncio.to_thread(carregar_marca)
+    marca = _cache_marca.obter("marca")
+    if marca is None:
+        async def consultar(conn):
+            return tuple((await conn.execute(text(f"SELECT {_SQL_MARCA}"))).one())
+        marca = await execute_with_retry_async(consultar)
+        _cache_marca.guardar("marca", marca, tamanho=0)
+    return marca
+
+def _sql_resumo(por_usuario: bool) -> str:
+    """Os quatro agregados do prompt (e a marca d'água) numa única consulta"""
+    filtro_itens = " JOIN vendas v ON v.id = i.id_venda WHERE v.id_usuario = :id_usuario" if por_usuario else ""
+    filtro_produtos = """ AND EXISTS (
+        SELECT 1 FROM itens_venda iv JOIN vendas v ON iv.id_venda = v.id
+        WHERE iv.id_produto = p.id AND v.id_usuario = :id_usuario
+    )""" if por_usuario else ""
+    filtro_transacoes = " WHERE " + FILTRO_USUARIO_SQL if por_usuario else ""
+
+    return f"""
+        SELECT
+            (SELECT p.nome
+             FROM itens_venda i
+             JOIN produtos p ON p.id = i.id_produto{filtro_itens}
+             GROUP BY p.nome
+             ORDER BY SUM(i.quantidade) DESC
+             LIMIT 1) AS produto_top,
+            (SELECT p.nome
+             FROM produtos p
+             WHERE p.preco_venda > 0{filtro_produtos}
+             ORDER BY (p.preco_venda - p.preco_compra) ASC
+             LIMIT 1) AS produto_menor_margem,
+            medias.receita_media,
+            medias.despesa_media,
+            {_SQL_MARCA}
+        FROM (
+            SELECT
+                AVG(CASE WHEN t.tipo = 'receita' THEN t.valor END) AS receita_media,
+                AVG(CASE WHEN t.tipo = 'despesa' THEN t.valor END) AS despesa_media
+            FROM transacoes t{filtro_transacoes}
+        ) medias
+    """
+
+# id_usuario (ou None para o geral) -> {"resumo", "marca", "verificado_em"}
+_cache_resumo = CacheModelos(max_itens=RECOMENDACAO_CACHE_MAX_ITENS, ttl=RESUMO_MAX_IDADE)
+
+@cronometrado("prompt_sql")
+def carregar_resumo(id_usuario: int = None) -> dict:
+    """Produto mais vendido, menor margem e médias de receita/despesa (geral ou por usuário).
+
+    O resultado fica em cache por RESUMO_TTL; depois disso só é recalculado se
+    a marca d'água mudou (ou passou de RESUMO_MAX_IDADE).
+    """
+    item = _cache_resumo.obter(id_usuario)
+    if item is not None:
+        if time.monotonic() - item["verificado_em"] < RESUMO_TTL:
+            return item["resumo"]
+
+        if carregar_marca() == item["marca"]:
+            item["verificado_em"] = time.monotonic()
+            return item["resumo"]
+
+    params = {"id_usuario": id_usuario} if id_usuario else {}
+    linha = execute_with_retry(
+        lambda session: session.execute(text(_sql_resumo(bool(id_usuario))), params).mappings().one()
+    )
+    return _guardar_resumo(id_usuario, linha)
+
+async def carregar_resumo_async(id_usuario: int = None) -> dict:
+    """carregar_resumo pelo engine assíncrono, com o mesmo cache"""
+    if not DB_ASYNC:
+        return await asyncio.to_thread(carregar_resumo, id_usuario)
+    return await _carregar_resumo_async(id_usuario)
+
+@cronometrado("prompt_sql")
+async def _carregar_resumo_async(id_usuario: int = None) -> dict:
+    item = _cache_resumo.obter(id_usuario)
+    if item is not None:
+        if time.monotonic() - item["verificado_em"] < RESUMO_TTL:
+            return item["resumo"]
+
+        if await carregar_marca_async() == item["marca"]:
+            item["verificado_em"] = time.monotonic()
+            return item["resumo"]
+
+    params = {"id_usuario": id_usuario} if id_usuario else {}
+
+    async def consultar(conn):
+        return (await conn.execute(text(_sql_resumo(bool(id_usuario))), params)).mappings().one()
+
+    return _guardar_resumo(id_usuario, await execute_with_retry_async(consultar))
+
+def _guardar_resumo(id_usuario, linha) -> dict:
+    resumo = {
+        "produto_top": linha["produto_top"] or "Nenhum",
+        "produto_menor_margem": linha["produto_menor_margem"] or "Nenhum",
+        "receita_media": float(linha["receita_media"] or 0),
+        "despesa_media": float(linha["despesa_media"] or 0),
+    }
+    _cache_resumo.guardar(id_usuario, {
+        "resumo": resumo,
+        "marca": (linha["marca_transacoes"], linha["marca_itens"]),
+        "verificado_em": time.monotonic()
+    }, tamanho=0)
+    return resumo
+
 # Função para gerar o prompt, com base nos dados do usuário
-def gerar_prompt_recomendacao(resultados_forecast: dict) -> str:
+def gerar_prompt_recomendacao(resultados_forecast: dict, id_usuario: int = None) -> str:
     """Gera um prompt textual para o Gemini baseado nos dados reais + previsão"""
 
     try:
-        with get_session() as session:
-            # Produto mais vendido
-            produto_top = session.execute(text("""
-                SELECT p.nome
-                FROM itens_venda i
-                JOIN produtos p ON p.id = i.id_produto
-                GROUP BY p.nome
-                ORDER BY SUM(i.quantidade) DESC
-                LIMIT 1
-            """)).scalar() or "Nenhum"
-
-            # Produto com menor margem
-            produto_menor_margem = session.execute(text("""
-                SELECT nome
-                FROM produtos
-                WHERE preco_venda > 0
-                ORDER BY (preco_venda - preco_compra) ASC
-                LIMIT 1
-            """)).scalar() or "Nenhum"
-
-            # Médias
-            receita_media = session.execute(text("""
-                SELECT AVG(valor) FROM transacoes WHERE tipo = 'receita'
-            """)).scalar() or 0
-
-            despesa_media = session.execute(text("""
-                SELECT AVG(valor) FROM transacoes WHERE tipo = 'despesa'
-            """)).scalar() or 0
-
-        # Dados da previsão
-        total_previsto = resultados_forecast.get("previsao_total", 0)
-        tipo = resultados_forecast.get("tipo", "geral")
-
-        # Montar prompt
-        prompt = f"""
+        return _montar_prompt(carregar_resumo(id_usuario), resultados_forecast)
+    except Exception as e:
+        logger.error(f"Erro ao gerar prompt de recomendação: {e}")
+        return "Não foi possível gerar recomendações no momento."
+
+async def gerar_prompt_recomendacao_async(resultados_forecast: dict, id_usuario: int = None) -> str:
+    """gerar_prompt_recomendacao com as consultas pelo engine assíncrono (DB_ASYNC)"""
+    try:
+        return _montar_prompt(await carregar_resumo_async(id_usuario), resultados_forecast)
+    except Exception as e:
+        logger.error(f"Erro ao gerar prompt de recomendação: {e}")
+        return "Não foi possível gerar recomendações no momento."
+
+def _montar_prompt(resumo: dict, resultados_forecast: dict) -> str:
+    """Texto do prompt a partir do resumo do banco e do resultado da previsão"""
+    produto_top = resumo["produto_top"]
+    produto_menor_margem = resumo["produto_menor_margem"]
+    receita_media = resumo["receita_media"]
+    despesa_media = resumo["despesa_media"]
+
+    # Dados da previsão
+    total_previsto = resultados_forecast.get("previsao_total", 0)
+    tipo = resultados_forecast.get("tipo", "geral")
+
+    # Montar prompt
+    prompt = f"""
 Você é um assistente financeiro. Com base nos seguintes dados,mesmoo que sejam fornecidos dados insuficientes, forneça até 3 recomendações de negócio claras, objetivas e práticas:
 
 - Receita média diária: R${receita_media:.2f}
@@ -60,33 +192,101 @@ Use frases curtas e diretas para um gestor de pequenas empresas.
 Responda em formato de tópicos.
 É obrigatório que tenham recomendações independente da situação, mesmo que sejam genéricas
 Se os dados estiverem muito longe da realidade, os ignore e não leve em consideração na sua recomendação. Por exemplo, valores iguais a 0
-        """.strip()
+    """.strip()
 
-        return prompt
+    return prompt
 
-    except Exception as e:
-        logger.error(f"Erro ao gerar prompt de recomendação: {e}")
-        return "Não foi possível gerar recomendações no momento."
+class BackendGemini:
+    """Backend real: configura o SDK e cria o GenerativeModel uma única vez"""
 
-# Aqui faz a chamada para a API e retorna um text
-def consultar_gemini(prompt: str) -> str:
-    try:
-        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-        if not GEMINI_API_KEY:
-            raise ValueError("❌ Chave da API Gemini não encontrada no ambiente (.env)!")
+    def __init__(self, modelo: str = GEMINI_MODELO):
+        self.nome_modelo = modelo
+        self._modelo = None
+
+    def _obter_modelo(self):
+        if self._modelo is None:
+            GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+            if not GEMINI_API_KEY:
+                raise ValueError("❌ Chave da API Gemini não encontrada no ambiente (.env)!")
+
+            # SDK importado só quando o backend é usado (o import custa ~0,7s)
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            self._modelo = genai.GenerativeModel(self.nome_modelo)
+        return self._modelo
+
+    async def gerar(self, prompt: str, timeout: float) -> str:
+        response = await self._obter_modelo().generate_content_async(
+            prompt, request_options={"timeout": timeout}
+        )
+        return response.text
 
-        genai.configure(api_key=GEMINI_API_KEY)
 
-        model = genai.GenerativeModel('gemini-2.5-pro')
+class BackendStub:
+    """Backend local para testes e testes de carga: não chama a API"""
 
-        response = model.generate_content(prompt)
+    def __init__(self, resposta: str = None, atraso: float = 0.0):
+        self.resposta = resposta or (
+            "- Revise os preços dos produtos com menor margem.\n"
+            "- Reforce o estoque do produto mais vendido.\n"
+            "- Acompanhe as despesas diárias em relação à receita prevista."
+        )
+        self.atraso = atraso
 
-        texto = response.text.strip()
+    async def gerar(self, prompt: str, timeout: float) -> str:
+        if self.atraso:
+            await asyncio.sleep(self.atraso)
+        return self.resposta
+
+
+def criar_backend(nome: str = RECOMENDACAO_BACKEND):
+    if nome == "stub":
+        return BackendStub(atraso=float(os.getenv("RECOMENDACAO_STUB_ATRASO", "0")))
+    return BackendGemini()
+
+
+class ClienteRecomendacao:
+    """Chamada assíncrona ao backend com timeout, cache por hash do prompt e deduplicação em voo"""
+
+    def __init__(self, backend=None, timeout: float = RECOMENDACAO_TIMEOUT, ttl: int = RECOMENDACAO_CACHE_TTL):
+        self.backend = backend or criar_backend()
+        self.timeout = timeout
+        self._cache = CacheModelos(max_itens=RECOMENDACAO_CACHE_MAX_ITENS, ttl=ttl)
+        self._em_voo = Coalescedor()
+
+    async def consultar(self, prompt: str) -> str:
+        chave = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        texto = self._cache.obter(chave)
+        if texto is not None:
+            return texto
+        return await self._em_voo.executar(chave, self._consultar, chave, prompt)
+
+    async def _consultar(self, chave: str, prompt: str) -> str:
+        try:
+            with medir("gemini"):
+                texto = await asyncio.wait_for(self.backend.gerar(prompt, self.timeout), self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini não respondeu em {self.timeout}s")
+            return "Erro ao gerar recomendação com IA."
+        except Exception as e:
+            logger.error(f"Erro ao consultar Gemini: {e}")
+            return "Erro ao gerar recomendação com IA."
+
+        texto = (texto or "").strip()
         if not texto:
             return "Nenhuma recomendação gerada pelo Gemini."
 
+        # Só respostas válidas vão para o cache; erros são tentados de novo na próxima chamada
+        self._cache.guardar(chave, texto, tamanho=len(texto))
         return texto
 
-    except Exception as e:
-        logger.error(f"Erro ao consultar Gemini: {e}")
-        return "Erro ao gerar recomendação com IA."
\ No newline at end of file
+    def estatisticas(self) -> dict:
+        return {**self._cache.estatisticas(), **self._em_voo.estatisticas()}
+
+
+# Instância global do cliente (backend escolhido por RECOMENDACAO_BACKEND)
+cliente_recomendacao = ClienteRecomendacao()
+
+# Aqui faz a chamada para a API e retorna um text
+async def consultar_gemini_async(prompt: str) -> str:
+    return await cliente_recomendacao.consultar(prompt)
@@ -1,20 +1,26 @@
 # Treinamento com SARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from sklearn.metrics import mean_squared_error
+from forecasting.backtest import BACKTEST_PASSO, backtest_estatistico, cortes_dobras
 import numpy as np
 
-def treinar_sarima(serie):
-    modelo = SARIMAX(serie, order=(1,1,1), seasonal_order=(1,1,1,7))
+def treinar_sarima(serie, order=(1,1,1), seasonal_order=(1,1,1,7)):
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    modelo = SARIMAX(serie, order=order, seasonal_order=seasonal_order)
     return modelo
 
-def avaliar_sarima(modelo, serie, horizon=15):
-    treino = serie[:-horizon]
-    teste = serie[-horizon:]
+def avaliar_sarima(serie, horizon=15, order=(1,1,1), seasonal_order=(1,1,1,7), maxiter=None,
+                   dobras=1, passo=BACKTEST_PASSO, detalhado=False):
+    """Ajusta o SARIMA na janela de treino da primeira dobra e mede o RMSE médio das `dobras` origens.
+
+    Retorna (resultado_ajustado, rmse); em caso de falha retorna (None, inf).
+    Com `detalhado` o segundo item é o backtest completo (métricas por dobra).
+    `maxiter` limita as iterações do otimizador (usado quando há prazo).
+    """
+    def ajustar(treino):
+        return treinar_sarima(treino, order, seasonal_order).fit(disp=False, **({"maxiter": maxiter} if maxiter else {}))
 
     try:
-        fitted = modelo.fit(disp=False)
-        preds = fitted.forecast(steps=horizon)
-        rmse = np.sqrt(mean_squared_error(teste, preds))
-        return rmse
+        cortes = cortes_dobras(len(serie), dobras, horizon, passo)
+        fitted, resultado = backtest_estatistico(serie, ajustar, cortes, horizon)
     except Exception:
-        return np.inf
+        return None, ({"dobras": [], "agregado": {}} if detalhado else np.inf)
+    return fitted, (resultado if detalhado else resultado["agregado"]["rmse"])
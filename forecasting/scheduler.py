@@ -0,0 +1,179 @@
+# Agendador em segundo plano que pré-calcula as respostas das rotas de análise.
+# As rotas registram aqui as funções que geram suas respostas; os handlers só leem o resultado
+# guardado. Resultado velho é servido na hora e atualizado em segundo plano (stale-while-revalidate).
+# "Usuários ativos" são as chaves consultadas recentemente, então não depende do esquema do banco.
+import asyncio
+import logging
+import os
+import random
+import time
+
+from forecasting.coalescer import Coalescedor
+
+logger = logging.getLogger(__name__)
+
+AGENDADOR_ATIVO = os.getenv("AGENDADOR_ATIVO", "True") == "True"
+AGENDADOR_INTERVALO = int(os.getenv("AGENDADOR_INTERVALO", "600"))        # segundos entre rodadas
+AGENDADOR_CONCORRENCIA = int(os.getenv("AGENDADOR_CONCORRENCIA", "2"))    # jobs simultâneos por rodada
+AGENDADOR_JITTER = float(os.getenv("AGENDADOR_JITTER", "30"))             # atraso aleatório por job (s)
+AGENDADOR_VALIDADE = int(os.getenv("AGENDADOR_VALIDADE", "300"))          # idade a partir da qual o resultado é velho
+AGENDADOR_JANELA_ATIVO = int(os.getenv("AGENDADOR_JANELA_ATIVO", str(24 * 3600)))  # chave sem acesso sai da rodada
+AGENDADOR_MAX_CHAVES = int(os.getenv("AGENDADOR_MAX_CHAVES", "1000"))     # chaves guardadas; além disso sai a menos acessada
+
+
+class Agendador:
+    """Guarda os resultados pré-calculados e os atualiza periodicamente"""
+
+    def __init__(self, intervalo: int = AGENDADOR_INTERVALO, concorrencia: int = AGENDADOR_CONCORRENCIA,
+                 jitter: float = AGENDADOR_JITTER, validade: int = AGENDADOR_VALIDADE,
+                 janela_ativo: int = AGENDADOR_JANELA_ATIVO, max_chaves: int = AGENDADOR_MAX_CHAVES):
+        self.intervalo = intervalo
+        self.concorrencia = max(1, concorrencia)
+        self.jitter = jitter
+        self.validade = validade
+        self.janela_ativo = janela_ativo
+        self.max_chaves = max(1, max_chaves)
+        self._funcoes = {}       # nome -> função assíncrona que gera o resultado
+        self._resultados = {}    # (nome, args) -> {"valor", "gerado_em"}
+        self._acessos = {}       # (nome, args) -> último acesso
+        self._em_execucao = Coalescedor()  # uma execução por chave
+        self._fila = []          # chaves aguardando vaga na rodada atual
+        self._execucoes = {}     # (nome, args) -> timings da última execução
+        self._tarefa = None
+        self.ultima_rodada = None
+        self.descartadas = 0
+
+    def registrar(self, nome: str, funcao):
+        """Registra a corrotina `funcao(*args)` que gera o resultado do job `nome`"""
+        self._funcoes[nome] = funcao
+
+    async def obter(self, nome: str, *args, vencido=None):
+        """Resultado do job; velho é servido e atualizado em segundo plano, ausente é calculado na hora.
+
+        `vencido(valor)` permite tratar o guardado como velho antes da validade (ex.: dados novos).
+        Os `args` entram na chave como vieram: quem chama deve normalizá-los antes.
+        """
+        chave = (nome, args)
+        if chave not in self._acessos and len(self._acessos) >= self.max_chaves:
+            # Chave nova com o limite cheio: sai a acessada há mais tempo
+            self._esquecer(min(self._acessos, key=self._acessos.get))
+            self.descartadas += 1
+        self._acessos[chave] = time.monotonic()
+
+        guardado = self._resultados.get(chave)
+        if guardado is None:
+            return await self._disparar(chave)
+
+        velho = time.monotonic() - guardado["gerado_em"] > self.validade or (vencido is not None and vencido(guardado["valor"]))
+        if velho and not self._em_execucao.em_andamento(chave):
+            self._disparar(chave).add_done_callback(self._ignorar_erro)
+        return guardado["valor"]
+
+    def _esquecer(self, chave):
+        # A chave deixa de ser atualizada e libera o resultado e os tempos
+        self._acessos.pop(chave, None)
+        self._resultados.pop(chave, None)
+        self._execucoes.pop(chave, None)
+
+    def _disparar(self, chave) -> asyncio.Future:
+        # Uma única execução por chave: quem chega durante a execução aguarda a mesma tarefa
+        return self._em_execucao.executar(chave, self._executar, chave)
+
+    @staticmethod
+    def _ignorar_erro(futuro):
+        # Erros da atualização em segundo plano já foram registrados em _executar
+        if not futuro.cancelled():
+            futuro.exception()
+
+    async def _executar(self, chave):
+        nome, args = chave
+        inicio = time.monotonic()
+        try:
+            valor = await self._funcoes[nome](*args)
+        except Exception as e:
+            if chave in self._acessos:
+                self._execucoes[chave] = {"inicio": time.time(), "duracao": time.monotonic() - inicio, "erro": str(e)}
+            logger.error(f"Job {nome}{args} falhou: {e}")
+            raise
+        # Chave esquecida durante a execução (inativa ou despejada) não volta a ser guardada
+        if chave in self._acessos:
+            self._resultados[chave] = {"valor": valor, "gerado_em": time.monotonic()}
+            self._execucoes[chave] = {"inicio": time.time(), "duracao": time.monotonic() - inicio, "erro": None}
+        return valor
+
+    async def executar_rodada(self):
+        """Atualiza todas as chaves acessadas dentro da janela de atividade"""
+        agora = time.monotonic()
+        for chave in [c for c, t in self._acessos.items() if agora - t > self.janela_ativo]:
+            self._esquecer(chave)
+
+        self._fila = list(self._acessos)
+        semaforo = asyncio.Semaphore(self.concorrencia)
+
+        async def job(chave):
+            # Jitter espalha os jobs para não bater no banco e no pool ao mesmo tempo
+            await asyncio.sleep(random.uniform(0, self.jitter))
+            async with semaforo:
+                if chave in self._fila:
+                    self._fila.remove(chave)
+                try:
+                    await self._disparar(chave)
+                except Exception:
+                    pass
+
+        inicio = time.monotonic()
+        await asyncio.gather(*(job(c) for c in list(self._fila)))
+        self.ultima_rodada = {"inicio": time.time(), "duracao": time.monotonic() - inicio, "jobs": len(self._acessos)}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.executar_rodada()
+            except Exception as e:
+                logger.error(f"Rodada do agendador falhou: {e}")
+
+    def iniciar(self):
+        if self._tarefa is None:
+            self._tarefa = asyncio.ensure_future(self._loop())
+            logger.info(f"Agendador de previsões iniciado (intervalo {self.intervalo}s)")
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    def estado(self) -> dict:
+        """Fila, jobs em execução e tempos da última execução de cada chave"""
+        agora = time.monotonic()
+
+        def nome_chave(chave):
+            nome, args = chave
+            return ":".join([nome, *map(str, args)])
+
+        return {
+            'ativo': self._tarefa is not None,
+            'intervalo': self.intervalo,
+            'validade': self.validade,
+            'chaves': len(self._acessos),
+            'max_chaves': self.max_chaves,
+            'descartadas': self.descartadas,
+            'ultima_rodada': self.ultima_rodada,
+            'fila': [nome_chave(c) for c in self._fila],
+            'em_execucao': [nome_chave(c) for c in self._em_execucao.chaves()],
+            'jobs': {
+                nome_chave(c): {
+                    **self._execucoes.get(c, {}),
+                    'idade': agora - self._resultados[c]["gerado_em"] if c in self._resultados else None
+                }
+                for c in self._acessos
+            }
+        }
+
+
+# Instância global do agendador
+agendador = Agendador()
@@ -0,0 +1,111 @@
+# Cópia local, em disco, da série diária de transações de cada (tipo, id_usuario).
+# Cada snapshot é um .npy de float64 (um valor por dia) lido com memory-map, sem cópia: a série
+# servida aponta direto para as páginas do arquivo. O banco remoto só é consultado para o delta
+# a partir do último dia do snapshot; a carga completa é refeita depois de SNAPSHOT_RECARGA
+# segundos, para pegar lançamentos retroativos, correções e exclusões.
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting.disk_store import ArmazemDisco
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ATIVO = os.getenv("SNAPSHOT_ATIVO", "True") == "True"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".snapshots")
+SNAPSHOT_MAX_MB = int(os.getenv("SNAPSHOT_MAX_MB", "50"))
+SNAPSHOT_RECARGA = int(os.getenv("SNAPSHOT_RECARGA", str(24 * 3600)))  # segundos entre cargas completas
+
+
+class SnapshotTransacoes(ArmazemDisco):
+    """Um .npy por (tipo, id_usuario), com limite de tamanho e despejo do mais antigo.
+
+    O nome do arquivo leva a chave, o primeiro dia da série e o horário da
+    última carga completa; o comprimento vem do próprio .npy. O diretório só é
+    listado no primeiro uso.
+    """
+
+    extensao = ".npy"
+    descricao = "Snapshots de transações"
+    rotulo_registros = "series"
+
+    def __init__(self, diretorio: str = SNAPSHOT_DIR, max_bytes: int = SNAPSHOT_MAX_MB * 1024 * 1024,
+                 recarga: int = SNAPSHOT_RECARGA, banco: str = None):
+        super().__init__(diretorio, max_bytes, banco)
+        self.recarga = recarga
+        self.leituras = 0
+        self.gravacoes = 0
+        self.inalterados = 0
+        self.expirados = 0
+
+    def _ler_nome(self, nome: str):
+        # {prefixo}__{AAAAMMDD}__{carga_completa}.npy -> (prefixo, início, carga_completa)
+        prefixo, inicio, completa = nome[:-len(".npy")].split("__")
+        return prefixo, pd.Timestamp(inicio), int(completa)
+
+    def carregar(self, chave):
+        """Série diária guardada (memory-map somente leitura), ou None se não há ou passou da recarga.
+
+        Com None quem chama deve refazer a carga completa e gravá-la com carga_completa=True.
+        """
+        prefixo = self._prefixo(chave)
+        item = self._entrada(prefixo)
+        if item is None:
+            return None
+        caminho, _, _, inicio, completa = item
+        if time.time() - completa > self.recarga:
+            self.expirados += 1
+            return None
+        try:
+            # np.asarray tira a subclasse memmap sem copiar; os dados continuam no arquivo
+            valores = np.asarray(np.load(caminho, mmap_mode="r"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot ilegível em {caminho}, descartado: {e}")
+            self._apagar(prefixo)
+            return None
+        self.leituras += 1
+        indice = pd.date_range(inicio, periods=len(valores), freq="D")
+        return pd.Series(valores, index=indice, name="valor", copy=False)
+
+    def guardar(self, chave, serie, carga_completa: bool = False):
+        """Grava a série substituindo o snapshot anterior; sem mudança nos valores, não regrava.
+
+        `carga_completa` marca que a série veio inteira do banco (reinicia o prazo de recarga).
+        """
+        if serie is None or len(serie) == 0:
+            return
+        prefixo = self._prefixo(chave)
+        valores = serie.to_numpy(dtype="float64")
+
+        anterior = self._entrada(prefixo)
+        completa = int(time.time()) if carga_completa or anterior is None else anterior[4]
+        inicio = serie.index[0]
+        caminho = os.path.join(self.diretorio, f"{prefixo}__{inicio:%Y%m%d}__{completa}.npy")
+
+        if anterior is not None and anterior[0] == caminho:
+            try:
+                if np.array_equal(np.load(caminho, mmap_mode="r"), valores):
+                    self.inalterados += 1
+                    return
+            except (OSError, ValueError):
+                pass
+
+        # Quem já leu o arquivo antigo por memory-map continua com as páginas dele
+        self._gravar(caminho, lambda f: np.save(f, valores))
+        self._registrar(prefixo, caminho, inicio, completa)
+        self.gravacoes += 1
+
+    def _contadores(self) -> dict:
+        return {
+            'leituras': self.leituras,
+            'gravacoes': self.gravacoes,
+            'inalterados': self.inalterados,
+            'expirados': self.expirados
+        }
+
+
+# Instância global dos snapshots
+snapshot_transacoes = SnapshotTransacoes()
@@ -3,7 +3,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.statespace.sarimax import SARIMAX
-from sklearn.metrics import mean_squared_error
 
 # Gerar série temporal fictícia
 np.random.seed(42)
@@ -25,8 +24,8 @@ arima_preds = arima_model.forecast(steps=horizon)
 sarima_preds = sarima_model.forecast(steps=horizon)
 
 # RMSE
-rmse_arima = np.sqrt(mean_squared_error(teste, arima_preds))
-rmse_sarima = np.sqrt(mean_squared_error(teste, sarima_preds))
+rmse_arima = np.sqrt(np.mean((teste.to_numpy() - np.asarray(arima_preds)) ** 2))
+rmse_sarima = np.sqrt(np.mean((teste.to_numpy() - np.asarray(sarima_preds)) ** 2))
 
 # Plot
 plt.figure(figsize=(12, 6))
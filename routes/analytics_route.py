@@ -1,31 +1,179 @@
 # Define as rotas sobre análise e previsão
 # Usa os dados das transações, aplica modelos ARIMA/SARIMA e retorna um JSON 
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
-from forecasting.forecasting_service import carregar_dados_transacao, prever, executar_previsao_completa
-from forecasting.model_selector import selecionar_melhor_modelo
-from forecasting.plot_service import gerar_grafico_forecast_json
-from forecasting.recommendation_service import gerar_prompt_recomendacao, consultar_gemini
+# Os ajustes rodam no executor de processos; a carga do banco roda em threads (ou no engine assíncrono com DB_ASYNC)
+# As respostas são pré-calculadas pelo agendador e os handlers só leem o resultado guardado
+# ETag = marca d'água dos dados + modelo atual: se o cliente já tem a versão, 304 sem carregar nada
+import hashlib
+import logging
+import os
+from typing import Literal
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+from forecasting.forecasting_service import carregar_serie, obter_previsao, executar_previsao_completa_async
+from forecasting.executor import executor_ajuste, FilaCheiaError
+from forecasting.model_cache import cache_modelos
+from forecasting.model_store import armazem_modelos, especificacao, rotulo_especificacao
+from forecasting.incremental import estados_modelo
+from forecasting.snapshot_store import snapshot_transacoes
+from forecasting.scheduler import agendador
+from forecasting.plot_service import GRAFICO_NIVEIS, GRAFICO_PONTOS, gerar_grafico_forecast_json, gerar_grafico_compacto, serializar_json
+from forecasting.recommendation_service import (
+    gerar_prompt_recomendacao_async, consultar_gemini_async, cliente_recomendacao, carregar_marca_async
+)
+
+logger = logging.getLogger(__name__)
+
+# max-age do Cache-Control; com 0 o navegador sempre revalida (barato, graças ao ETag)
+HTTP_MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "0"))
 
 router = APIRouter()
 
+def _fila_cheia(e: FilaCheiaError):
+    return JSONResponse(
+        status_code=503,
+        content={"erro": str(e)},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def _espec_modelo(tipo, id_usuario) -> str:
+    # Modelo em memória para a série; muda quando há reseleção mesmo sem dados novos
+    estado = estados_modelo.obter((tipo, id_usuario))
+    return rotulo_especificacao(especificacao(estado["modelo"])) if estado is not None else "nenhum"
+
+def _etag(recurso: tuple, marca, espec: str) -> str:
+    h = hashlib.blake2b(repr((recurso, marca, espec)).encode(), digest_size=10)
+    # Fraco: o corpo pode ir comprimido ou não
+    return f'W/"{h.hexdigest()}"'
+
+async def _etag_atual(recurso: tuple, tipo, id_usuario):
+    """ETag da versão atual, ou None se a marca d'água não puder ser consultada"""
+    try:
+        marca = await carregar_marca_async()
+    except Exception as e:
+        logger.warning(f"Marca d'água indisponível, sem ETag: {e}")
+        return None
+    return _etag(recurso, marca, _espec_modelo(tipo, id_usuario))
+
+def _nao_modificado(request: Request, etag) -> bool:
+    enviado = request.headers.get("if-none-match")
+    if etag is None or not enviado:
+        return False
+    # Comparação fraca: ignora o prefixo W/
+    candidatos = {parte.strip().removeprefix("W/") for parte in enviado.split(",")}
+    return "*" in candidatos or etag.removeprefix("W/") in candidatos
+
+def _vencido(etag):
+    # Resultado guardado gerado com outra marca d'água: servido, mas já atualizado em segundo plano
+    return lambda valor: etag is not None and valor[0] != etag
+
+def _cabecalhos(etag) -> dict:
+    cabecalhos = {"Cache-Control": f"private, max-age={HTTP_MAX_AGE}, must-revalidate"}
+    if etag is not None:
+        cabecalhos["ETag"] = etag
+    return cabecalhos
+
+# Tamanhos servidos no formato compacto: o pedido sobe para o próximo da lista, para que cada
+# combinação guardada pelo agendador seja reaproveitada e o número de chaves fique limitado
+GRAFICO_TAMANHOS = tuple(sorted({100, 250, GRAFICO_PONTOS, 1000, 2500, 5000}))
+
+def _pontos_normalizados(pontos: int) -> int:
+    return next((t for t in GRAFICO_TAMANHOS if t >= pontos), GRAFICO_TAMANHOS[-1])
+
+def _recurso_grafico(tipo, formato, pontos, bandas=False) -> tuple:
+    # `pontos` só muda o formato compacto
+    return ("grafico", tipo, formato, pontos if formato == "compacto" else None, bandas)
+
+# Geradores das respostas; o agendador os chama na primeira requisição e depois em segundo plano.
+# Devolvem (etag, conteúdo): o ETag é o dos dados usados, que pode ser mais antigo que o atual.
+async def _gerar_grafico(tipo: str, formato: str = "plotly", pontos: int = GRAFICO_PONTOS, bandas: bool = False):
+    recurso = _recurso_grafico(tipo, formato, pontos, bandas)
+    marca = await carregar_marca_async()
+    serie = await carregar_serie(tipo)
+    # Faixas de incerteza só quando pedidas: a resposta padrão continua só com a previsão pontual
+    niveis = GRAFICO_NIVEIS if bandas else None
+    nome_modelo, _, previsao, prazo_excedido = await obter_previsao(serie, tipo, None, 30, niveis)
+    if formato == "compacto":
+        grafico = gerar_grafico_compacto(serie, previsao, pontos)
+    else:
+        grafico = gerar_grafico_forecast_json(serie, previsao)
+    # Qual modelo foi servido e se o prazo cortou a seleção
+    grafico["modelo"] = nome_modelo
+    grafico["prazo_excedido"] = prazo_excedido
+    etag = _etag(recurso, marca, _espec_modelo(tipo, None))
+    if formato == "compacto":
+        # Guardado já serializado: as requisições seguintes só devolvem os bytes
+        return etag, serializar_json(grafico)
+    return etag, grafico
+
+async def _gerar_recomendacoes(id_usuario: int):
+    marca = await carregar_marca_async()
+    resultados = await executar_previsao_completa_async(id_usuario=id_usuario)
+    prompt = await gerar_prompt_recomendacao_async(resultados, id_usuario)
+    texto = await consultar_gemini_async(prompt)
+    etag = _etag(("recomendacoes", id_usuario), marca, _espec_modelo("receita", id_usuario))
+    return etag, {
+        "recomendacoes": texto,
+        "modelo": resultados["modelo"],
+        "prazo_excedido": resultados.get("prazo_excedido", False)
+    }
+
+agendador.registrar("grafico", _gerar_grafico)
+agendador.registrar("recomendacoes", _gerar_recomendacoes)
+
 # Rota para gráficos de previsão
 @router.get("/grafico-json")
-def grafico_json(tipo: str = Query("receita", enum=["receita", "despesa"])):
+async def grafico_json(request: Request,
+                       tipo: Literal["receita", "despesa"] = Query("receita"),
+                       formato: Literal["plotly", "compacto"] = Query("plotly"),
+                       pontos: int = Query(GRAFICO_PONTOS, ge=3, le=5000),
+                       bandas: bool = Query(False)):
+    pontos = _pontos_normalizados(pontos) if formato == "compacto" else GRAFICO_PONTOS
     try:
-        dados = carregar_dados_transacao(tipo)
-        modelo, _ = selecionar_melhor_modelo(dados["valor"])
-        previsao = prever(modelo, 30)
-        return JSONResponse(content=gerar_grafico_forecast_json(dados["valor"], previsao))
+        etag = await _etag_atual(_recurso_grafico(tipo, formato, pontos, bandas), tipo, None)
+        if _nao_modificado(request, etag):
+            return Response(status_code=304, headers=_cabecalhos(etag))
+
+        if formato == "compacto":
+            etag, conteudo = await agendador.obter("grafico", tipo, formato, pontos, bandas, vencido=_vencido(etag))
+            return Response(content=conteudo, media_type="application/json", headers=_cabecalhos(etag))
+        etag, conteudo = await agendador.obter("grafico", tipo, formato, pontos, bandas, vencido=_vencido(etag))
+        return JSONResponse(content=conteudo, headers=_cabecalhos(etag))
+    except FilaCheiaError as e:
+        return _fila_cheia(e)
     except Exception as e:
         return {"erro": str(e)}
 
 # Rota de recomendações para o usuário 
 @router.get("/recomendacoes")
-def recomendacoes(id_usuario: int):
-    resultados = executar_previsao_completa(id_usuario=id_usuario)
-    prompt = gerar_prompt_recomendacao(resultados)
-    texto = consultar_gemini(prompt)
-    return {"recomendacoes": texto}
+async def recomendacoes(request: Request, id_usuario: int):
+    try:
+        etag = await _etag_atual(("recomendacoes", id_usuario), "receita", id_usuario)
+        if _nao_modificado(request, etag):
+            return Response(status_code=304, headers=_cabecalhos(etag))
+
+        etag, conteudo = await agendador.obter("recomendacoes", id_usuario, vencido=_vencido(etag))
+        return JSONResponse(content=conteudo, headers=_cabecalhos(etag))
+    except FilaCheiaError as e:
+        return _fila_cheia(e)
+
+# Estado da fila de ajustes (para dimensionar FIT_WORKERS/FIT_MAX_FILA)
+@router.get("/executor")
+def estado_executor():
+    return executor_ajuste.estado()
 
+# Contadores do cache de modelos ajustados (acertos/erros/despejos), das recomendações, dos estados incrementais,
+# do armazém e dos snapshots em disco
+@router.get("/cache")
+def estado_cache():
+    return {
+        **cache_modelos.estatisticas(),
+        'recomendacoes': cliente_recomendacao.estatisticas(),
+        'estados': estados_modelo.estatisticas(),
+        'armazem': armazem_modelos.estatisticas(),
+        'snapshots': snapshot_transacoes.estatisticas()
+    }
 
+# Fila e tempos do agendador de pré-cálculo
+@router.get("/agendador")
+def estado_agendador():
+    return agendador.estado()
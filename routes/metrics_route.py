@@ -0,0 +1,27 @@
+# Expõe as métricas no formato texto do Prometheus: histogramas das etapas e das requisições,
+# mais o estado do pool do banco, dos caches, dos estados incrementais, do armazém de modelos, dos snapshots
+# e da fila de ajustes
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from database import get_connection_info
+from forecasting.executor import executor_ajuste
+from forecasting.incremental import estados_modelo
+from forecasting.metrics import gauges, registro
+from forecasting.model_cache import cache_modelos
+from forecasting.model_store import armazem_modelos
+from forecasting.recommendation_service import cliente_recomendacao
+from forecasting.snapshot_store import snapshot_transacoes
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metricas():
+    linhas = registro.exportar()
+    linhas += gauges("db_pool", get_connection_info())
+    linhas += gauges("cache_modelos", cache_modelos.estatisticas())
+    linhas += gauges("cache_recomendacoes", cliente_recomendacao.estatisticas())
+    linhas += gauges("estados_modelo", estados_modelo.estatisticas())
+    linhas += gauges("armazem_modelos", armazem_modelos.estatisticas())
+    linhas += gauges("snapshots", snapshot_transacoes.estatisticas())
+    linhas += gauges("executor", executor_ajuste.estado())
+    return PlainTextResponse("\n".join(linhas) + "\n", media_type="text/plain; version=0.0.4")
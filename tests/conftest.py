@@ -0,0 +1,39 @@
+# Ambiente dos testes: SQLite temporário e sem armazém de modelos, snapshots ou agendador,
+# definido antes de qualquer import do app (os módulos leem o ambiente no import)
+import os
+import sys
+import tempfile
+
+_DIRETORIO = tempfile.mkdtemp(prefix="testes_api_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DIRETORIO, 'testes.db')}"
+os.environ["MODEL_STORE_ATIVO"] = "False"
+os.environ["SNAPSHOT_ATIVO"] = "False"
+os.environ["AGENDADOR_ATIVO"] = "False"
+os.environ["SNAPSHOT_DIR"] = os.path.join(_DIRETORIO, "snapshots")
+os.environ["MODEL_STORE_DIR"] = os.path.join(_DIRETORIO, "modelos")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from database import get_engine  # noqa: E402
+
+TABELAS = (
+    "CREATE TABLE produtos (id INTEGER PRIMARY KEY, nome TEXT, preco_venda REAL, preco_compra REAL)",
+    'CREATE TABLE transacoes (id INTEGER PRIMARY KEY, data TIMESTAMP, valor NUMERIC, tipo TEXT, "produtoId" INTEGER)',
+    "CREATE TABLE vendas (id INTEGER PRIMARY KEY, id_usuario INTEGER)",
+    "CREATE TABLE itens_venda (id INTEGER PRIMARY KEY, id_venda INTEGER, id_produto INTEGER, quantidade INTEGER)",
+)
+
+
+@pytest.fixture
+def banco():
+    """Esquema vazio recriado a cada teste; devolve o engine do app"""
+    engine = get_engine()
+    with engine.begin() as conn:
+        for tabela in ("transacoes", "itens_venda", "vendas", "produtos"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela}"))
+        for ddl in TABELAS:
+            conn.execute(text(ddl))
+    return engine
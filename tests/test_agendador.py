@@ -0,0 +1,46 @@
+# Chaves do agendador: o número guardado é limitado (sai a acessada há mais tempo) e uma chave
+# inativa some por inteiro, com resultado e tempos de execução.
+import asyncio
+
+from forecasting.scheduler import Agendador
+
+
+def _agendador(**opcoes):
+    agendador = Agendador(jitter=0, **opcoes)
+    execucoes = []
+
+    async def gerar(*args):
+        execucoes.append(args)
+        return args
+
+    agendador.registrar("job", gerar)
+    return agendador, execucoes
+
+
+def test_limite_de_chaves_descarta_a_menos_acessada():
+    agendador, _ = _agendador(max_chaves=2)
+
+    async def cenario():
+        await agendador.obter("job", 1)
+        await agendador.obter("job", 2)
+        await agendador.obter("job", 1)
+        await agendador.obter("job", 3)
+
+    asyncio.run(cenario())
+
+    assert set(agendador._acessos) == {("job", (1,)), ("job", (3,))}
+    assert set(agendador._resultados) == set(agendador._execucoes) == set(agendador._acessos)
+    assert agendador.estado()["descartadas"] == 1
+
+
+def test_chave_inativa_sai_com_os_tempos():
+    agendador, execucoes = _agendador(janela_ativo=-1)
+
+    async def cenario():
+        await agendador.obter("job", 1)
+        await agendador.executar_rodada()
+
+    asyncio.run(cenario())
+
+    assert execucoes == [(1,)]
+    assert not agendador._acessos and not agendador._resultados and not agendador._execucoes
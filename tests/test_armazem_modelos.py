@@ -0,0 +1,59 @@
+# Armazém de modelos em disco: registros de outro banco ou de outra série não são reaproveitados,
+# e arquivos estranhos no diretório são descartados sem executar nada.
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from forecasting.incremental import novo_estado
+from forecasting.baseline_model import ModeloBaseline
+from forecasting.model_store import ArmazemModelos
+
+CHAVE = ("receita", None)
+
+
+def _serie(valores, inicio="2024-01-01"):
+    return pd.Series(np.asarray(valores, dtype="float64"), index=pd.date_range(inicio, periods=len(valores), freq="D"))
+
+
+def _guardar(diretorio, banco, serie):
+    armazem = ArmazemModelos(diretorio=str(diretorio), banco=banco)
+    estado = novo_estado(serie, ModeloBaseline("MEDIA_MOVEL", serie), "MEDIA_MOVEL", {"MEDIA_MOVEL": 1.5})
+    armazem.guardar(CHAVE, estado)
+    return armazem
+
+
+def test_chave_inclui_o_banco(tmp_path):
+    serie = _serie(range(20))
+    _guardar(tmp_path, "banco-a", serie)
+
+    estado = ArmazemModelos(diretorio=str(tmp_path), banco="banco-a").carregar(CHAVE, serie)
+    assert estado["nome"] == "MEDIA_MOVEL" and estado["scores"] == {"MEDIA_MOVEL": 1.5}
+    assert ArmazemModelos(diretorio=str(tmp_path), banco="banco-b").carregar(CHAVE, serie) is None
+
+
+def test_serie_diferente_nao_reaproveita(tmp_path):
+    _guardar(tmp_path, "banco", _serie(range(20)))
+    armazem = ArmazemModelos(diretorio=str(tmp_path), banco="banco")
+
+    # Mesma série com dias novos (e o último dia guardado completado): serve de base
+    estendida = _serie(list(range(19)) + [25, 30, 31])
+    assert armazem.carregar(CHAVE, estendida) is not None
+    # Histórico diferente ou outro início: o registro é de outros dados
+    assert armazem.carregar(CHAVE, _serie([7.0] + list(range(1, 20)))) is None
+    assert armazem.carregar(CHAVE, _serie(range(20), inicio="2024-01-02")) is None
+    assert armazem.incompativeis == 2
+    assert armazem.estatisticas()["registros"] == 1
+
+
+def test_arquivo_adulterado_e_descartado(tmp_path):
+    _guardar(tmp_path, "banco", _serie(range(20)))
+    caminho = next(entrada.path for entrada in os.scandir(tmp_path))
+    # Um pickle no lugar do registro não é desserializado como objeto
+    with open(caminho, "wb") as f:
+        pickle.dump({"versao": 2}, f)
+
+    armazem = ArmazemModelos(diretorio=str(tmp_path), banco="banco")
+    assert armazem.carregar(CHAVE) is None
+    assert not os.path.exists(caminho)
@@ -0,0 +1,49 @@
+# Regressão do filtro por usuário: um produto vendido várias vezes ao mesmo usuário
+# não pode repetir as transações (o JOIN antigo em itens_venda/vendas dobrava os valores).
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from forecasting.forecasting_service import carregar_dados_transacao, carregar_dados_transacao_async
+
+
+@pytest.fixture
+def produto_vendido_duas_vezes(banco):
+    with banco.begin() as conn:
+        conn.execute(text("INSERT INTO produtos VALUES (1, 'A', 10, 5), (2, 'B', 8, 7)"))
+        # Usuário 1 comprou o produto 1 em duas vendas; o usuário 2 comprou só o produto 2
+        conn.execute(text("INSERT INTO vendas VALUES (1, 1), (2, 1), (3, 2)"))
+        conn.execute(text("INSERT INTO itens_venda VALUES (1, 1, 1, 2), (2, 2, 1, 3), (3, 3, 2, 1)"))
+        conn.execute(text(
+            'INSERT INTO transacoes (data, valor, tipo, "produtoId") VALUES '
+            "('2024-01-01 10:00:00', 10, 'receita', 1), ('2024-01-01 12:00:00', 5, 'receita', 1), "
+            "('2024-01-03 09:00:00', 7, 'receita', 2)"
+        ))
+    return banco
+
+
+@pytest.mark.parametrize("agregar_no_banco", [True, False])
+def test_produto_vendido_duas_vezes_nao_duplica(produto_vendido_duas_vezes, agregar_no_banco):
+    df = carregar_dados_transacao(tipo="receita", id_usuario=1, agregar_no_banco=agregar_no_banco)
+
+    assert df["valor"].sum() == 15.0
+    assert len(df) == 1
+    assert df.loc["2024-01-01", "valor"] == 15.0
+
+
+def test_sem_usuario_soma_todas_as_transacoes(produto_vendido_duas_vezes):
+    df = carregar_dados_transacao(tipo="receita")
+
+    assert df["valor"].sum() == 22.0
+    # 01/01 a 03/01, com o dia sem transação preenchido com 0
+    assert len(df) == 3
+    assert df["valor"].tolist() == [15.0, 0.0, 7.0]
+
+
+def test_carga_assincrona_igual_a_sincrona(produto_vendido_duas_vezes):
+    pytest.importorskip("aiosqlite")
+    datas, valores = asyncio.run(carregar_dados_transacao_async(tipo="receita", id_usuario=1))
+
+    assert len(datas) == 1
+    assert valores.sum() == 15.0
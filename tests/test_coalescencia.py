@@ -0,0 +1,75 @@
+# Chamadas concorrentes de obter_previsao para a mesma série disparam uma única seleção de modelo,
+# e todas recebem o mesmo resultado ou a mesma exceção.
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import forecasting.forecasting_service as fs
+from forecasting.baseline_model import ModeloBaseline
+from forecasting.incremental import estados_modelo
+from forecasting.model_cache import cache_modelos
+
+CHAMADAS = 8
+
+
+@pytest.fixture
+def serie():
+    dias = pd.date_range("2024-01-01", periods=60, freq="D")
+    return pd.Series(np.arange(60, dtype="float64"), index=dias, name="valor")
+
+
+@pytest.fixture
+def selecao_contada(monkeypatch):
+    """Substitui selecionar_com_prazo por um stub lento que conta as chamadas"""
+    cache_modelos.limpar()
+    estados_modelo.limpar()
+    monkeypatch.setattr(fs, "ORDEM_AUTO", False)
+    chamadas = []
+
+    def instalar(erro=None):
+        async def selecionar(serie, prazo=fs.PREVISAO_PRAZO, ordens=None):
+            chamadas.append(serie)
+            await asyncio.sleep(0.05)
+            if erro is not None:
+                raise erro
+            return ModeloBaseline("MEDIA_MOVEL", serie), "MEDIA_MOVEL", {"MEDIA_MOVEL": 1.0}, False
+
+        monkeypatch.setattr(fs, "selecionar_com_prazo", selecionar)
+        return chamadas
+
+    yield instalar
+    cache_modelos.limpar()
+    estados_modelo.limpar()
+
+
+def test_chamadas_concorrentes_ajustam_uma_vez(serie, selecao_contada):
+    chamadas = selecao_contada()
+
+    async def cenario():
+        return await asyncio.gather(*(fs.obter_previsao(serie, "receita", 1, periodo=7) for _ in range(CHAMADAS)))
+
+    resultados = asyncio.run(cenario())
+
+    assert len(chamadas) == 1
+    assert {nome for nome, _, _, _ in resultados} == {"MEDIA_MOVEL"}
+    assert all(previsao.equals(resultados[0][2]) for _, _, previsao, _ in resultados)
+
+
+def test_excecao_compartilhada_e_nao_guardada(serie, selecao_contada):
+    erro = RuntimeError("ajuste falhou")
+    chamadas = selecao_contada(erro)
+
+    async def cenario():
+        return await asyncio.gather(*(fs.obter_previsao(serie, "receita", 1) for _ in range(CHAMADAS)),
+                                    return_exceptions=True)
+
+    resultados = asyncio.run(cenario())
+
+    assert len(chamadas) == 1
+    assert all(r is erro for r in resultados)
+
+    # A falha não fica em voo nem em cache: a próxima chamada ajusta de novo
+    asyncio.run(cenario())
+    assert len(chamadas) == 2
@@ -0,0 +1,58 @@
+# Snapshots locais da série: vencido o prazo de recarga a carga volta a ser completa (mesmo com
+# estado incremental em memória), e snapshots de outro banco não são reaproveitados.
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import forecasting.forecasting_service as fs
+from forecasting.incremental import estados_modelo, novo_estado
+from forecasting.snapshot_store import SnapshotTransacoes
+
+CHAVE = ("receita", None)
+
+
+def _inserir(banco, linhas):
+    with banco.begin() as conn:
+        conn.execute(text('INSERT INTO transacoes (data, valor, tipo, "produtoId") VALUES (:d, :v, \'receita\', 1)'),
+                     [{"d": d, "v": v} for d, v in linhas])
+
+
+@pytest.fixture
+def snapshots(banco, tmp_path, monkeypatch):
+    with banco.begin() as conn:
+        conn.execute(text("INSERT INTO produtos VALUES (1, 'A', 10, 5)"))
+    _inserir(banco, [("2024-01-01 10:00:00", 10), ("2024-01-03 10:00:00", 20)])
+    armazem = SnapshotTransacoes(diretorio=str(tmp_path), banco="banco-de-teste")
+    monkeypatch.setattr(fs, "SNAPSHOT_ATIVO", True)
+    monkeypatch.setattr(fs, "snapshot_transacoes", armazem)
+    estados_modelo.limpar()
+    yield armazem
+    estados_modelo.limpar()
+
+
+def test_snapshot_vencido_recarrega_tudo(banco, snapshots):
+    serie = fs.carregar_serie_sincrona(tipo="receita")
+    assert serie.tolist() == [10.0, 0.0, 20.0]
+    # Estado incremental com a mesma série: não pode servir de base depois que o snapshot vence
+    estados_modelo.guardar(CHAVE, novo_estado(serie, None, "MEDIA_MOVEL", {}), tamanho=0)
+
+    # Lançamento retroativo, anterior à marca d'água: só uma carga completa o enxerga
+    _inserir(banco, [("2024-01-02 10:00:00", 5)])
+    snapshots.recarga = -1
+    serie = fs.carregar_serie_sincrona(tipo="receita")
+    assert serie.tolist() == [10.0, 5.0, 20.0]
+    assert snapshots.expirados == 1
+
+    # A carga completa reinicia o prazo: a próxima volta a partir do snapshot, só com o delta
+    snapshots.recarga = 3600
+    leituras = snapshots.leituras
+    assert fs.carregar_serie_sincrona(tipo="receita").tolist() == [10.0, 5.0, 20.0]
+    assert snapshots.leituras == leituras + 1
+
+
+def test_chave_inclui_o_banco(tmp_path):
+    serie = pd.Series([1.0, 2.0], index=pd.date_range("2024-01-01", periods=2, freq="D"))
+    SnapshotTransacoes(diretorio=str(tmp_path), banco="banco-a").guardar(CHAVE, serie, carga_completa=True)
+
+    assert SnapshotTransacoes(diretorio=str(tmp_path), banco="banco-a").carregar(CHAVE).tolist() == [1.0, 2.0]
+    assert SnapshotTransacoes(diretorio=str(tmp_path), banco="banco-b").carregar(CHAVE) is None